@@ -1,13 +1,35 @@
 """
 Flask application factory
 """
-from flask import Flask
+from flask import Flask, Response, render_template, session
 from flask_session import Session
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.middleware.proxy_fix import ProxyFix
+from whitenoise import WhiteNoise
+from app.middleware import HTTPSRedirectMiddleware
 from config.config import config
 from config.database import db
-from services.auth_service import AuthService
+from config.redis_client import get_redis
+from utils.json_response import OrjsonProvider
+from services.auth_service import auth_service
+from services.quiz_service import quiz_service
+from services.activity_service import activity_service
+from functools import lru_cache
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=4096)
+def _format_date(date_obj):
+    return date_obj.strftime('%B %d, %Y')
+
+def format_date(date_obj):
+    """Format date for display (formatted strings are cached per date)"""
+    if date_obj:
+        return _format_date(date_obj)
+    return ''
+
 def create_app(config_name='default'):
     """Create and configure Flask application"""
     
@@ -18,24 +40,42 @@ def create_app(config_name='default'):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
     
+    # Debug logging is skipped cheaply unless LOG_LEVEL asks for it
+    logging.basicConfig(level=app.config['LOG_LEVEL'])
+    
+    # Use orjson for all JSON encoding/decoding
+    app.json = OrjsonProvider(app)
+    
+    # Reuse compiled templates across workers and restarts
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+    
     # Initialize extensions
     db.init_app(app)
     
-    # Configure Flask-Session
-    Session(app)
+    # Write user activity in background batches instead of per request
+    activity_service.start()
     
-    # Handle HTTPS in production (behind reverse proxy)
-    @app.before_request
-    def force_https():
-        from flask import request, redirect, url_for
-        # Only force HTTPS for production (non-localhost domains)
-        if (request.headers.get('X-Forwarded-Proto') == 'http' and 
-            not request.host.startswith('localhost') and 
-            not request.host.startswith('127.0.0.1')):
-            return redirect(request.url.replace('http://', 'https://'))
+    # Configure Flask-Session (Redis keeps session reads off the filesystem);
+    # 'cookie' keeps Flask's built-in signed cookie session instead
+    if app.config.get('SESSION_TYPE') == 'redis':
+        app.config['SESSION_REDIS'] = get_redis()
+    if app.config.get('SESSION_TYPE') != 'cookie':
+        Session(app)
     
-    # Initialize authentication service
-    auth_service = AuthService()
+    # Serve /static/ from WhiteNoise before requests reach Flask
+    # (url_for('static', ...) still resolves through Flask's static route)
+    app.wsgi_app = WhiteNoise(
+        app.wsgi_app,
+        root=app.static_folder,
+        prefix='static/',
+        max_age=app.config['STATIC_MAX_AGE'],
+        autorefresh=app.debug
+    )
+    
+    # Handle HTTPS in production (behind reverse proxy)
+    # ProxyFix applies X-Forwarded-Proto/Host before the redirect check runs
+    app.wsgi_app = HTTPSRedirectMiddleware(app.wsgi_app)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
     
     # Register blueprints
     from app.routes.main import main_bp
@@ -47,30 +87,30 @@ def create_app(config_name='default'):
     app.register_blueprint(quiz_bp)
     
     # Error handlers
+    # Error pages for anonymous visitors are rendered once at startup (see below);
+    # pending flash messages need a live render so they are shown and consumed
+    error_pages = {}
+    
+    def render_error_page(template, status):
+        if status in error_pages and '_flashes' not in session and not auth_service.is_authenticated():
+            return Response(error_pages[status], status, mimetype='text/html')
+        return render_template(template), status
+    
     @app.errorhandler(404)
     def not_found_error(error):
-        from flask import render_template
-        return render_template('errors/404.html'), 404
+        return render_error_page('errors/404.html', 404)
     
     @app.errorhandler(500)
     def internal_error(error):
-        from flask import render_template
-        return render_template('errors/500.html'), 500
+        return render_error_page('errors/500.html', 500)
     
     # Context processors
     @app.context_processor
     def utility_processor():
         """Make utility functions available in templates"""
-        def format_date(date_obj):
-            """Format date for display"""
-            if date_obj:
-                return date_obj.strftime('%B %d, %Y')
-            return ''
-        
         def get_quiz_service():
             """Get quiz service instance"""
-            from services.quiz_service import QuizService
-            return QuizService()
+            return quiz_service
         
         return {
             'format_date': format_date,
@@ -80,8 +120,6 @@ def create_app(config_name='default'):
     @app.context_processor
     def auth_processor():
         """Make authentication info available in templates"""
-        from services.auth_service import AuthService
-        auth_service = AuthService()
         return {
             'current_user': auth_service.get_current_user_info() if auth_service.is_authenticated() else None
         }
@@ -94,4 +132,20 @@ def create_app(config_name='default'):
         if auth_service.is_authenticated():
             auth_service.update_user_activity()
     
+    # Compile every template now so the first requests in each worker don't pay for it
+    # (loaded from the bytecode cache when another worker has already compiled them)
+    for template_name in app.jinja_env.list_templates(extensions=['html']):
+        try:
+            app.jinja_env.get_template(template_name)
+        except Exception as e:
+            logger.warning("Could not preload template %s: %s", template_name, e)
+    
+    # Pre-render the anonymous error pages
+    try:
+        with app.test_request_context():
+            error_pages[404] = render_template('errors/404.html')
+            error_pages[500] = render_template('errors/500.html')
+    except Exception as e:
+        logger.warning("Could not pre-render error pages: %s", e)
+    
     return app
@@ -0,0 +1,28 @@
+"""
+WSGI middleware for the Flask application
+"""
+from urllib.parse import urlsplit
+from werkzeug.wsgi import get_current_url
+
+class HTTPSRedirectMiddleware:
+    """Redirect plain-HTTP requests forwarded by the reverse proxy to HTTPS.
+    
+    Works on the raw WSGI environ, so requests that are already HTTPS pass
+    straight through without Flask building a request object for the check.
+    """
+    
+    # Hosts that are never redirected (local development)
+    LOCAL_HOSTS = ('localhost', '127.0.0.1')
+    
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+    
+    def __call__(self, environ, start_response):
+        if (environ.get('HTTP_X_FORWARDED_PROTO') == 'http' and
+            not environ.get('HTTP_HOST', '').startswith(self.LOCAL_HOSTS)):
+            url = urlsplit(get_current_url(environ))._replace(scheme='https').geturl()
+            # Permanent, so browsers cache the upgrade and skip this hop next time
+            start_response('301 Moved Permanently', [('Location', url), ('Content-Length', '0')])
+            return [b'']
+        
+        return self.wsgi_app(environ, start_response)
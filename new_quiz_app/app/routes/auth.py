@@ -2,15 +2,12 @@
 Authentication routes for Microsoft OAuth
 """
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from services.auth_service import AuthService
+from services.auth_service import auth_service
 from config.auth_config import AuthConfig
 
 # Create blueprint
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
-# Initialize services
-auth_service = AuthService()
-
 @auth_bp.route('/login')
 def login():
     """Microsoft login page"""
@@ -89,12 +86,9 @@ def logout():
     return redirect(url_for('main.index'))
 
 @auth_bp.route('/profile')
+@auth_service.require_auth(message="Please sign in to view your profile", user_id_required=False)
 def profile():
     """User profile page"""
-    if not auth_service.is_authenticated():
-        flash("Please sign in to view your profile", "info")
-        return redirect(url_for('auth.login'))
-    
     user_info = auth_service.get_current_user_info()
     if not user_info:
         flash("Error loading user information", "error")
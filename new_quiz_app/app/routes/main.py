@@ -1,51 +1,68 @@
 """
 Main application routes
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
-from services.auth_service import AuthService
-from services.quiz_service import QuizService
-from services.analytics_service import AnalyticsService
-from datetime import date
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, g
+from config.database import db
+from services.auth_service import auth_service
+from services.quiz_service import quiz_service
+from services.analytics_service import analytics_service, ANALYTICS_CACHE_TTL
+from utils.json_response import json_response, cacheable_json_response
+from utils.quiz_upload import load_quiz_file, exceeds_upload_limit, decode_quiz_payload, UploadedQuiz
+from utils.dates import today_str
+from collections import namedtuple
+import time
+import msgspec
+import orjson
 
 # Create blueprint
 main_bp = Blueprint('main', __name__)
 
-# Initialize services
-auth_service = AuthService()
-quiz_service = QuizService()
-analytics_service = AnalyticsService()
+# Admin quiz listings only need these fields, not the question bodies
+# (older quiz documents without total_questions get it counted server-side)
+QUIZ_LIST_PROJECTION = {
+    "quiz_date": 1,
+    "created_at": 1,
+    "total_questions": {"$ifNull": ["$total_questions", {"$size": {"$ifNull": ["$questions", []]}}]}
+}
+QUIZZES_PER_PAGE = 50
+
+# Landing page row for one quiz
+QuizRow = namedtuple('QuizRow', 'quiz_date total_questions status')
+
+# Status shown on every quiz when the user can't be identified
+_GUEST_STATUS = {
+    'status': 'not_attempted',
+    'message': 'Please log in to attempt',
+    'action': 'login',
+    'button_text': 'Login Required',
+    'button_class': 'btn-secondary'
+}
 
 @main_bp.route('/')
+@auth_service.require_auth(user_id_required=False)
 def index():
     """Main landing page"""
-    if not auth_service.is_authenticated():
-        return redirect(url_for('auth.login'))
-    
     # Get user info
     user_info = auth_service.get_current_user_info()
-    user_id = auth_service.get_user_id()
+    user_id = g.user_id
     
     # Get recent quizzes (past 7 days)
-    recent_quizzes = quiz_service.get_recent_quizzes(7)
+    recent_quizzes = quiz_service.get_cached_recent_quizzes(7)
+    
+    # Look up the user's status on every listed quiz at once
+    statuses = quiz_service.get_user_statuses_bulk(
+        user_id, [quiz_info['quiz_date'] for quiz_info in recent_quizzes]
+    ) if user_id and recent_quizzes else {}
     
     # Add status information for each quiz
-    quiz_data = []
-    for quiz_info in recent_quizzes:
-        quiz_date = quiz_info['quiz_date']
-        status = quiz_service.get_user_quiz_status(user_id, quiz_date) if user_id else {
-            'status': 'not_attempted',
-            'message': 'Please log in to attempt',
-            'action': 'login',
-            'button_text': 'Login Required',
-            'button_class': 'btn-secondary'
-        }
-        
-        quiz_data.append({
-            'quiz': quiz_info['quiz'],
-            'quiz_date': quiz_date,
-            'total_questions': quiz_info['total_questions'],
-            'status': status
-        })
+    quiz_data = [
+        QuizRow(
+            quiz_info['quiz_date'],
+            quiz_info['total_questions'],
+            statuses[quiz_info['quiz_date']] if user_id else _GUEST_STATUS
+        )
+        for quiz_info in recent_quizzes
+    ]
     
     return render_template("main/index.html", 
                          quiz_data=quiz_data,
@@ -53,22 +70,19 @@ def index():
                          today=quiz_service.get_today_string())
 
 @main_bp.route('/admin')
+@auth_service.require_auth(message="Please sign in to access admin panel", user_id_required=False)
 def admin_dashboard():
     """Admin dashboard"""
-    if not auth_service.is_authenticated():
-        flash("Please sign in to access admin panel", "info")
-        return redirect(url_for('auth.login'))
-    
     # Check if user is admin (you can implement admin role checking here)
     user_info = auth_service.get_current_user_info()
     
     # Get recent quizzes
     recent_quizzes = []
-    from config.database import db
     if db.is_connected():
         try:
             recent_quizzes = list(db.quizzes_collection.find(
                 {},
+                projection=QUIZ_LIST_PROJECTION,
                 sort=[("created_at", -1)],
                 limit=10
             ))
@@ -82,36 +96,45 @@ def admin_dashboard():
                          recent_quizzes=recent_quizzes)
 
 @main_bp.route('/admin/quizzes')
+@auth_service.require_auth(message="Please sign in to access admin panel", user_id_required=False)
 def admin_quizzes():
     """Admin quiz management"""
-    if not auth_service.is_authenticated():
-        flash("Please sign in to access admin panel", "info")
-        return redirect(url_for('auth.login'))
-    
-    # Get all quizzes
+    # Get one page of quizzes
+    page = max(request.args.get('page', 1, type=int), 1)
     quizzes = []
-    from config.database import db
+    has_next = False
     if db.is_connected():
         try:
+            # Fetch one extra row to know whether a next page exists
             quizzes = list(db.quizzes_collection.find(
                 {},
-                sort=[("quiz_date", -1)]
+                projection=QUIZ_LIST_PROJECTION,
+                sort=[("quiz_date", -1)],
+                skip=(page - 1) * QUIZZES_PER_PAGE,
+                limit=QUIZZES_PER_PAGE + 1
             ))
+            has_next = len(quizzes) > QUIZZES_PER_PAGE
+            quizzes = quizzes[:QUIZZES_PER_PAGE]
         except Exception as e:
             flash(f"Error loading quizzes: {str(e)}", "error")
     else:
         flash("Database not connected", "warning")
     
-    return render_template("admin/quizzes.html", quizzes=quizzes)
+    return render_template("admin/quizzes.html", 
+                         quizzes=quizzes,
+                         page=page,
+                         has_next=has_next)
 
 @main_bp.route('/admin/upload-quiz', methods=['GET', 'POST'])
+@auth_service.require_auth(message="Please sign in to access admin panel", user_id_required=False)
 def admin_upload_quiz():
     """Admin quiz upload"""
-    if not auth_service.is_authenticated():
-        flash("Please sign in to access admin panel", "info")
-        return redirect(url_for('auth.login'))
-    
     if request.method == 'POST':
+        # Reject oversized uploads before parsing the form
+        if exceeds_upload_limit(request):
+            flash("Quiz file is too large", "error")
+            return render_template("admin/upload_quiz.html"), 413
+        
         try:
             # Handle quiz upload
             quiz_date = request.form.get('quiz_date')
@@ -122,8 +145,7 @@ def admin_upload_quiz():
                 return render_template("admin/upload_quiz.html")
             
             # Read and parse quiz file
-            import json
-            quiz_data = json.load(quiz_file)
+            quiz_data = load_quiz_file(quiz_file)
             quiz_data['quiz_date'] = quiz_date
             
             # Create quiz
@@ -142,12 +164,9 @@ def admin_upload_quiz():
 
 @main_bp.route('/admin/analytics')
 @main_bp.route('/admin/analytics/')
+@auth_service.require_auth(message="Please sign in to access admin panel", user_id_required=False)
 def admin_analytics():
     """Admin analytics dashboard"""
-    if not auth_service.is_authenticated():
-        flash("Please sign in to access admin panel", "info")
-        return redirect(url_for('auth.login'))
-    
     # Get 7-day analytics
     analytics_data = analytics_service.get_last_7_days_stats()
     
@@ -158,12 +177,9 @@ def admin_analytics():
     return render_template("admin/analytics.html", analytics=analytics_data)
 
 @main_bp.route('/admin/analytics/quiz/<quiz_date>')
+@auth_service.require_auth(message="Please sign in to access admin panel", user_id_required=False)
 def admin_quiz_analytics(quiz_date):
     """Detailed analytics for a specific quiz"""
-    if not auth_service.is_authenticated():
-        flash("Please sign in to access admin panel", "info")
-        return redirect(url_for('auth.login'))
-    
     # Get detailed quiz analytics
     quiz_analytics = analytics_service.get_quiz_analytics(quiz_date)
     
@@ -179,24 +195,27 @@ def api_analytics_7_days():
     """API endpoint for 7-day analytics (no authentication required for testing)"""
     try:
         analytics_data = analytics_service.get_last_7_days_stats()
-        return jsonify(analytics_data)
+        if "error" in analytics_data:
+            return json_response(analytics_data)
+        return cacheable_json_response(analytics_data, ANALYTICS_CACHE_TTL, ANALYTICS_CACHE_TTL, public=False)
     except Exception as e:
-        return jsonify({"error": f"Error getting analytics: {str(e)}"}), 500
+        return json_response({"error": f"Error getting analytics: {str(e)}"}, 500)
 
 @main_bp.route('/api/analytics/quiz/<quiz_date>', methods=['GET'])
 def api_analytics_quiz(quiz_date):
     """API endpoint for specific quiz analytics (no authentication required for testing)"""
     try:
         quiz_analytics = analytics_service.get_quiz_analytics(quiz_date)
-        return jsonify(quiz_analytics)
+        if "error" in quiz_analytics:
+            return json_response(quiz_analytics)
+        return cacheable_json_response(quiz_analytics, ANALYTICS_CACHE_TTL, ANALYTICS_CACHE_TTL, public=False)
     except Exception as e:
-        return jsonify({"error": f"Error getting quiz analytics: {str(e)}"}), 500
+        return json_response({"error": f"Error getting quiz analytics: {str(e)}"}, 500)
 
 @main_bp.route('/api/debug/session', methods=['GET'])
 def debug_session():
     """Debug endpoint to check session data (for troubleshooting authentication)"""
-    from flask import session
-    return jsonify({
+    return json_response({
         "session_keys": list(session.keys()),
         "has_user_key": "user" in session,
         "user_value": session.get("user"),
@@ -213,149 +232,138 @@ def api_admin_analytics():
         analytics_data = analytics_service.get_last_7_days_stats()
         
         if "error" in analytics_data:
-            return jsonify({"error": analytics_data["error"]}), 500
+            return json_response({"error": analytics_data["error"]}, 500)
         
-        return jsonify(analytics_data)
+        return json_response(analytics_data)
     except Exception as e:
-        return jsonify({"error": f"Error loading analytics: {str(e)}"}), 500
+        return json_response({"error": f"Error loading analytics: {str(e)}"}, 500)
 
-@main_bp.route('/api/upload-quiz-test', methods=['POST'])
-def api_upload_quiz_test():
-    """API endpoint for uploading quiz without authentication (for testing)"""
-    try:
-        # Get JSON data from request
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"success": False, "message": "No JSON data provided"}), 400
-        
-        # Check if data is an array (your format) or object (standard format)
-        if isinstance(data, list):
-            # Your format: array of questions
-            questions = data
-            quiz_date = request.args.get('quiz_date') or date.today().strftime('%Y-%m-%d')
-            
-            # Create quiz data structure
-            quiz_data = {
-                "quiz_date": quiz_date,
-                "questions": questions
-            }
-        elif isinstance(data, dict):
-            # Standard format: object with quiz_date and questions
-            quiz_data = data
-        else:
-            return jsonify({"success": False, "message": "Invalid data format"}), 400
-        
-        # Validate quiz data
-        if 'questions' not in quiz_data:
-            return jsonify({"success": False, "message": "Questions array is required"}), 400
-        
-        if not quiz_data['questions']:
-            return jsonify({"success": False, "message": "Questions array cannot be empty"}), 400
-        
-        # Create quiz
-        success, message, quiz = quiz_service.create_quiz(quiz_data)
-        
-        if success:
-            return jsonify({
-                "success": True,
-                "message": f"Quiz uploaded successfully for {quiz_data['quiz_date']}",
-                "quiz_id": str(quiz.id) if hasattr(quiz, 'id') else None,
-                "questions_count": len(quiz_data['questions'])
-            })
-        else:
-            return jsonify({"success": False, "message": message}), 400
-            
-    except Exception as e:
-        return jsonify({"success": False, "message": f"Error uploading quiz: {str(e)}"}), 500
+def _quiz_from_list(data, req):
+    """Array of questions; the quiz date comes from ?quiz_date= (defaults to today)"""
+    return {
+        "quiz_date": req.args.get('quiz_date') or today_str(),
+        "questions": msgspec.to_builtins(data)
+    }
+
+def _quiz_from_object(data, req):
+    """Object with quiz_date and questions"""
+    return msgspec.to_builtins(data)
+
+# Upload payload normalizers keyed by the decoded payload type
+_QUIZ_NORMALIZERS = {
+    list: _quiz_from_list,
+    UploadedQuiz: _quiz_from_object
+}
 
 @main_bp.route('/api/upload-quiz', methods=['POST'])
+@main_bp.route('/api/upload-quiz-test', methods=['POST'])
 def api_upload_quiz():
     """API endpoint for uploading quiz with custom payload format (no authentication required)"""
+    # Reject oversized payloads before reading the body
+    if exceeds_upload_limit(request):
+        return json_response({"success": False, "message": "Quiz payload too large"}, 413)
+    
     try:
-        # Get JSON data from request
-        data = request.get_json()
+        # Get JSON data from request (not cached on the request, it is parsed only once)
+        raw_data = request.get_data(cache=False)
+        if not raw_data:
+            return json_response({"success": False, "message": "No JSON data provided"}, 400)
+        
+        # Parse and check the payload shape in one pass
+        try:
+            data = decode_quiz_payload(raw_data)
+        except ValueError as e:
+            return json_response({"success": False, "message": str(e)}, 400)
         
         if not data:
-            return jsonify({"success": False, "message": "No JSON data provided"}), 400
+            return json_response({"success": False, "message": "No JSON data provided"}, 400)
         
-        # Check if data is an array (your format) or object (standard format)
-        if isinstance(data, list):
-            # Your format: array of questions
-            questions = data
-            quiz_date = request.args.get('quiz_date') or date.today().strftime('%Y-%m-%d')
-            
-            # Create quiz data structure
-            quiz_data = {
-                "quiz_date": quiz_date,
-                "questions": questions
-            }
-        elif isinstance(data, dict):
-            # Standard format: object with quiz_date and questions
-            quiz_data = data
-        else:
-            return jsonify({"success": False, "message": "Invalid data format"}), 400
+        # Accept either an array of questions or a full quiz object
+        quiz_data = _QUIZ_NORMALIZERS[type(data)](data, request)
         
         # Validate quiz data
-        if 'questions' not in quiz_data:
-            return jsonify({"success": False, "message": "Questions array is required"}), 400
-        
         if not quiz_data['questions']:
-            return jsonify({"success": False, "message": "Questions array cannot be empty"}), 400
+            return json_response({"success": False, "message": "Questions array cannot be empty"}, 400)
         
         # Create quiz
         success, message, quiz = quiz_service.create_quiz(quiz_data)
         
         if success:
-            return jsonify({
+            return json_response({
                 "success": True,
                 "message": f"Quiz uploaded successfully for {quiz_data['quiz_date']}",
-                "quiz_id": str(quiz.id) if hasattr(quiz, 'id') else None,
+                "quiz_id": quiz.id,
                 "questions_count": len(quiz_data['questions'])
             })
         else:
-            return jsonify({"success": False, "message": message}), 400
+            return json_response({"success": False, "message": message}, 400)
             
     except Exception as e:
-        return jsonify({"success": False, "message": f"Error uploading quiz: {str(e)}"}), 500
+        return json_response({"success": False, "message": f"Error uploading quiz: {str(e)}"}, 500)
+
+# Probe responses are serialized once and reused; the health check result is
+# kept for a couple of seconds so load balancer polling doesn't hit MongoDB
+HEALTH_CACHE_TTL = 2
+HEALTH_MAX_AGE = 5  # Cache-Control max-age for dashboards polling /health
+_health_cache = (0.0, None)
+_api_test_cache = (None, None)
+
+def _health_body() -> bytes:
+    """Get the serialized health check result, re-checking the database at most every HEALTH_CACHE_TTL seconds"""
+    global _health_cache
+    checked_at, body = _health_cache
+    now = time.monotonic()
+    
+    if body is None or now - checked_at >= HEALTH_CACHE_TTL:
+        db_healthy, db_message = db.health_check()
+        
+        body = orjson.dumps({
+            "status": "healthy" if db_healthy else "unhealthy",
+            "database": db_message,
+            "timestamp": today_str()
+        })
+        _health_cache = (now, body)
+    
+    return body
+
+def _api_test_body() -> bytes:
+    """Get the serialized /api/test payload (rebuilt when the day changes)"""
+    global _api_test_cache
+    today = today_str()
+    cached_day, body = _api_test_cache
+    
+    if cached_day != today:
+        body = orjson.dumps({
+            "success": True,
+            "message": "API is working!",
+            "timestamp": today
+        })
+        _api_test_cache = (today, body)
+    
+    return body
 
 @main_bp.route('/api/test', methods=['GET'])
 def api_test():
     """Simple test endpoint without authentication"""
-    return jsonify({
-        "success": True,
-        "message": "API is working!",
-        "timestamp": date.today().isoformat()
-    })
+    return json_response(_api_test_body())
 
 @main_bp.route('/health')
 def health_check():
     """Health check endpoint"""
-    if hasattr(quiz_service, 'db') and quiz_service.db:
-        db_healthy, db_message = quiz_service.db.health_check()
-    else:
-        # Try to get database instance directly
-        from config.database import db
-        db_healthy, db_message = db.health_check()
-    
-    return jsonify({
-        "status": "healthy" if db_healthy else "unhealthy",
-        "database": db_message,
-        "timestamp": date.today().isoformat()
-    })
+    return cacheable_json_response(_health_body(), HEALTH_MAX_AGE)
 
 @main_bp.route('/api/quiz-stats/<quiz_date>')
 def quiz_stats(quiz_date):
     """Get quiz statistics for a specific date"""
     if not auth_service.is_authenticated():
-        return jsonify({"error": "Authentication required"}), 401
+        return json_response({"error": "Authentication required"}, 401)
     
     try:
         stats = quiz_service.get_quiz_statistics(quiz_date)
         
         if "error" in stats:
-            return jsonify(stats), 404
+            return json_response(stats, 404)
         
-        return jsonify(stats)
+        return json_response(stats)
     except Exception as e:
-        return jsonify({"error": f"Service error: {str(e)}"}), 500 
\ No newline at end of file
+        return json_response({"error": f"Service error: {str(e)}"}, 500) 
\ No newline at end of file
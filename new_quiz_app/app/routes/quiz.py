@@ -1,58 +1,65 @@
 """
 Quiz routes for taking quizzes and managing attempts
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
-from services.auth_service import AuthService
-from services.quiz_service import QuizService
-from datetime import date
+from flask import Blueprint, render_template, request, redirect, url_for, flash, g
+from services.auth_service import auth_service
+from services.quiz_service import quiz_service
+from utils.json_response import json_response
+from collections import namedtuple
+import logging
 
 # Create blueprint
 quiz_bp = Blueprint('quiz', __name__, url_prefix='/quiz')
 
-# Initialize services
-auth_service = AuthService()
-quiz_service = QuizService()
+logger = logging.getLogger(__name__)
+
+# Completed attempt shown on the result page
+ResultData = namedtuple('ResultData', 'score total_questions percentage completed_at answers answer_lookup questions')
+
+def build_result_data(attempt, quiz):
+    """Build the result page data for a completed attempt"""
+    answers_summary = attempt.get_answers_summary()
+    
+    return ResultData(
+        score=attempt.score,
+        total_questions=attempt.total_questions,
+        percentage=attempt.percentage,
+        completed_at=attempt.completed_at,
+        answers=answers_summary,
+        # Lookup dict for faster answer matching
+        answer_lookup={ans['question_index']: ans for ans in answers_summary},
+        questions=quiz.questions
+    )
 
 @quiz_bp.route('/')
 @quiz_bp.route('/<quiz_date>')
+@auth_service.require_auth
 def take_quiz(quiz_date=None):
     """Take quiz for a specific date or today"""
-    if not auth_service.is_authenticated():
-        return redirect(url_for('auth.login'))
-    
     # If no date specified, use today
     if not quiz_date:
         quiz_date = quiz_service.get_today_string()
     
-    user_id = auth_service.get_user_id()
-    if not user_id:
-        flash("Error: Could not identify user", "error")
-        return redirect(url_for('auth.login'))
+    user_id = g.user_id
+    
+    # Start a new attempt or resume the existing one (one upsert)
+    success, message, attempt = quiz_service.start_quiz_attempt(user_id, quiz_date)
     
     # Check if user has already completed this quiz
-    existing_attempt = quiz_service.get_user_attempt(user_id, quiz_date)
-    if existing_attempt and existing_attempt.is_completed:
+    if attempt and attempt.is_completed:
         flash(f"You have already completed the quiz for {quiz_date}. View your results below.", "info")
         return redirect(url_for('quiz.view_result', quiz_date=quiz_date))
     
-    # Check if user can attempt this quiz
-    can_attempt, message = quiz_service.can_user_attempt_quiz(user_id, quiz_date)
-    if not can_attempt:
+    if not success:
         flash(message, "warning")
         return redirect(url_for('main.index'))
     
-    # Get quiz
+    # Get quiz (already cached by start_quiz_attempt)
     quiz = quiz_service.get_quiz_by_date(quiz_date)
     if not quiz:
         flash(f"No quiz available for date {quiz_date}", "error")
         return redirect(url_for('main.index'))
     
-    # Start or resume attempt
-    success, message, attempt = quiz_service.start_quiz_attempt(user_id, quiz_date)
-    if not success:
-        flash(message, "error")
-        return redirect(url_for('main.index'))
-    
     # Get user's current answers for this attempt
     user_answers = {}
     if attempt and attempt.answers:
@@ -66,14 +73,10 @@ def take_quiz(quiz_date=None):
                          attempt=attempt)
 
 @quiz_bp.route('/<quiz_date>/save-answer', methods=['POST'])
+@auth_service.require_auth(api=True)
 def save_answer(quiz_date):
     """Save user's answer for a question"""
-    if not auth_service.is_authenticated():
-        return jsonify({"success": False, "message": "Authentication required"}), 401
-    
-    user_id = auth_service.get_user_id()
-    if not user_id:
-        return jsonify({"success": False, "message": "User identification failed"}), 400
+    user_id = g.user_id
     
     try:
         data = request.get_json()
@@ -81,95 +84,67 @@ def save_answer(quiz_date):
         selected_answer = data.get('selected_answer')
         
         if question_index is None or selected_answer is None:
-            return jsonify({"success": False, "message": "Missing question index or answer"}), 400
+            return json_response({"success": False, "message": "Missing question index or answer"}, 400)
+        
+        # Answers are keyed by integer question index
+        try:
+            question_index = int(question_index)
+        except (TypeError, ValueError):
+            return json_response({"success": False, "message": "Invalid question index"}, 400)
         
         # Save answer
         success, message = quiz_service.save_answer(user_id, quiz_date, question_index, selected_answer)
         
         if success:
-            return jsonify({"success": True, "message": message})
+            return json_response({"success": True, "message": message})
         else:
-            return jsonify({"success": False, "message": message}), 400
+            return json_response({"success": False, "message": message}, 400)
             
     except Exception as e:
-        return jsonify({"success": False, "message": f"Error saving answer: {str(e)}"}), 500
+        return json_response({"success": False, "message": f"Error saving answer: {str(e)}"}, 500)
 
 @quiz_bp.route('/<quiz_date>/save-progress', methods=['POST'])
+@auth_service.require_auth(api=True)
 def save_progress(quiz_date):
     """Save multiple answers at once (auto-save)."""
-    if not auth_service.is_authenticated():
-        return jsonify({"success": False, "message": "Authentication required"}), 401
-    
-    user_id = auth_service.get_user_id()
-    if not user_id:
-        return jsonify({"success": False, "message": "User identification failed"}), 400
+    user_id = g.user_id
     
     try:
         data = request.get_json() or {}
         answers = data.get('answers', {})  # {question_index: "A"}
-
-        # DEBUG: Log what answers are being submitted
-        print(f"🔍 SAVE_PROGRESS DEBUG: User {user_id}")
-        print(f"   Quiz Date: {quiz_date}")
-        print(f"   Received answers: {answers}")
-        print(f"   Answer count: {len(answers)}")
         
         if not isinstance(answers, dict):
-            return jsonify({"success": False, "message": "Invalid answers payload"}), 400
+            return json_response({"success": False, "message": "Invalid answers payload"}, 400)
+        
+        # JSON object keys arrive as strings
+        try:
+            answers = {int(k): v for k, v in answers.items() if v is not None}
+        except (TypeError, ValueError):
+            return json_response({"success": False, "message": "Invalid answers payload"}, 400)
         
         if not answers:
-            return jsonify({"success": True, "message": "No answers to save"})
+            return json_response({"success": True, "message": "No answers to save"})
         
-        # Check if quiz is already completed - don't allow saving after completion
-        attempt = quiz_service.get_user_attempt(user_id, quiz_date)
-        if attempt and attempt.is_completed:
-            return jsonify({"success": False, "message": "Quiz already completed - cannot save progress"})
-
-        # Save each provided answer
-        saved_count = 0
-        failed_saves = []
-        for k, v in answers.items():
-            try:
-                q_index = int(k)
-            except Exception:
-                # keys may already be ints
-                q_index = k
-            if q_index is None or v is None:
-                continue
-            
-            success, msg = quiz_service.save_answer(user_id, quiz_date, q_index, v)
-            if success:
-                saved_count += 1
-                print(f"   ✅ Saved Q{q_index}: {v}")
-            else:
-                failed_saves.append((q_index, v, msg))
-                print(f"   ❌ Failed Q{q_index}: {v} - {msg}")
-
-        # Log final result
-        print(f"   📊 Final: {saved_count} saved, {len(failed_saves)} failed")
+        # Save all provided answers in one write (refused once the quiz is completed)
+        success, message, saved_count = quiz_service.save_answers_bulk(user_id, quiz_date, answers)
+        if not success:
+            if message == "Quiz already completed":
+                message = "Quiz already completed - cannot save progress"
+            return json_response({"success": False, "message": message})
         
-        if failed_saves:
-            print(f"   ⚠️ Failed saves: {failed_saves}")
-
-        return jsonify({"success": True, "message": f"Progress saved ({saved_count} answers)"})
+        return json_response({"success": True, "message": f"Progress saved ({saved_count} answers)"})
     except Exception as e:
 
-        return jsonify({"success": False, "message": f"Error saving progress: {str(e)}"}), 500
+        return json_response({"success": False, "message": f"Error saving progress: {str(e)}"}, 500)
 
 @quiz_bp.route('/<quiz_date>/submit', methods=['POST'])
+@auth_service.require_auth
 def submit_quiz(quiz_date):
     """Submit completed quiz"""
-    if not auth_service.is_authenticated():
-        return redirect(url_for('auth.login'))
-    
-    user_id = auth_service.get_user_id()
-    if not user_id:
-        flash("Error: Could not identify user", "error")
-        return redirect(url_for('main.index'))
+    user_id = g.user_id
     
     # FORCE SAVE ALL CURRENT ANSWERS FROM FORM DATA
     form_data = request.form
-    print(f"🔍 SUBMIT FORM DATA: {dict(form_data)}")
     
     # Extract all answers from form submission
     submitted_answers = {}
@@ -180,61 +155,22 @@ def submit_quiz(quiz_date):
                 # Extract the index from "answers[0]" -> 0
                 question_index = int(key[8:-1])  # Remove "answers[" and "]"
                 submitted_answers[question_index] = value
-                print(f"🔍 Form answer index {question_index}: {value}")
             except ValueError:
                 continue
     
-    print(f"🔍 Total form answers: {len(submitted_answers)}")
-    
-    # Save each answer from form data (overwrite any previous saves)
-    for q_index, answer in submitted_answers.items():
-        success, msg = quiz_service.save_answer(user_id, quiz_date, q_index, answer)
-        if success:
-            print(f"✅ Force saved Q{q_index}: {answer}")
-        else:
-            print(f"❌ Failed to save Q{q_index}: {answer} - {msg}")
-    
-    # Submit quiz
-    success, message, score_result = quiz_service.submit_quiz(user_id, quiz_date)
+    # Save the form answers and score the attempt with one read and one write
+    success, message, attempt = quiz_service.submit_quiz(user_id, quiz_date, submitted_answers)
     
     if success:
-        # Get detailed result data for review section
-        attempt = quiz_service.get_user_attempt(user_id, quiz_date)
+        logger.debug("Submitted %s form answers for %s on %s", len(submitted_answers), user_id, quiz_date)
+        
+        # The scored attempt is already in hand; only the questions are needed for the review section
         quiz = quiz_service.get_quiz_by_date(quiz_date)
         
-        if attempt and quiz:
-            # Prepare full result data including answers summary
-            answers_summary = attempt.get_answers_summary()
-            print(f"🔍 RESULT DEBUG: Answers summary: {answers_summary}")
-            
-            # Create a lookup dict for faster answer matching
-            answer_lookup = {}
-            for ans in answers_summary:
-                answer_lookup[ans['question_index']] = ans
-                print(f"🔍 Added to lookup: Q{ans['question_index']} = {ans['selected_answer']}")
-            
-            print(f"🔍 Final answer_lookup keys: {list(answer_lookup.keys())}")
-            print(f"🔍 Quiz has {len(quiz.questions)} questions")
-            
-            # Check for missing answers
-            for i in range(len(quiz.questions)):
-                if i not in answer_lookup:
-                    print(f"⚠️ Missing answer for question {i}")
-            
-            result_data = {
-                'score': attempt.score,
-                'total_questions': attempt.total_questions,
-                'percentage': attempt.percentage,
-                'completed_at': attempt.completed_at,
-                'answers': answers_summary,
-                'answer_lookup': answer_lookup,
-                'questions': quiz.questions
-            }
-            
+        if quiz:
             return render_template("quiz/result.html", 
                                  quiz_date=quiz_date,
-                                 score_result=score_result,
-                                 result_data=result_data,
+                                 result_data=build_result_data(attempt, quiz),
                                  score=attempt.score,
                                  total=attempt.total_questions,
                                  percentage=attempt.percentage)
@@ -242,22 +178,20 @@ def submit_quiz(quiz_date):
             # Fallback to basic result
             return render_template("quiz/result.html", 
                              quiz_date=quiz_date,
-                             score_result=score_result)
+                             score_result={
+                                 'score': attempt.score,
+                                 'total_questions': attempt.total_questions,
+                                 'percentage': round(attempt.percentage, 2)
+                             })
     else:
         flash(message, "error")
         return redirect(url_for('quiz.take_quiz', quiz_date=quiz_date))
 
 @quiz_bp.route('/<quiz_date>/result')
+@auth_service.require_auth(message="Please sign in to view results")
 def view_result(quiz_date):
     """View quiz result"""
-    if not auth_service.is_authenticated():
-        flash("Please sign in to view results", "info")
-        return redirect(url_for('auth.login'))
-    
-    user_id = auth_service.get_user_id()
-    if not user_id:
-        flash("Error: Could not identify user", "error")
-        return redirect(url_for('main.index'))
+    user_id = g.user_id
     
     # Get user's attempt
     attempt = quiz_service.get_user_attempt(user_id, quiz_date)
@@ -275,42 +209,18 @@ def view_result(quiz_date):
         flash("Quiz not found", "error")
         return redirect(url_for('main.index'))
     
-    # Prepare result data
-    answers_summary = attempt.get_answers_summary()
-    
-    # Create a lookup dict for faster answer matching
-    answer_lookup = {}
-    for ans in answers_summary:
-        answer_lookup[ans['question_index']] = ans
-    
-    result_data = {
-        'score': attempt.score,
-        'total_questions': attempt.total_questions,
-        'percentage': attempt.percentage,
-        'completed_at': attempt.completed_at,
-        'answers': answers_summary,
-        'answer_lookup': answer_lookup,
-        'questions': quiz.questions
-    }
-    
     return render_template("quiz/result.html", 
                          quiz_date=quiz_date,
-                         result_data=result_data,
+                         result_data=build_result_data(attempt, quiz),
                          score=attempt.score,
                          total=attempt.total_questions,
                          percentage=attempt.percentage)
 
 @quiz_bp.route('/history')
+@auth_service.require_auth(message="Please sign in to view your history")
 def quiz_history():
     """View user's quiz history"""
-    if not auth_service.is_authenticated():
-        flash("Please sign in to view your history", "info")
-        return redirect(url_for('auth.login'))
-    
-    user_id = auth_service.get_user_id()
-    if not user_id:
-        flash("Error: Could not identify user", "error")
-        return redirect(url_for('main.index'))
+    user_id = g.user_id
     
     # Get user's quiz history
     history = quiz_service.get_user_quiz_history(user_id)
@@ -318,24 +228,20 @@ def quiz_history():
     return render_template("quiz/history.html", history=history)
 
 @quiz_bp.route('/<quiz_date>/progress')
+@auth_service.require_auth(api=True)
 def quiz_progress(quiz_date):
     """Get quiz progress for AJAX updates"""
-    if not auth_service.is_authenticated():
-        return jsonify({"success": False, "message": "Authentication required"}), 401
-    
-    user_id = auth_service.get_user_id()
-    if not user_id:
-        return jsonify({"success": False, "message": "User identification failed"}), 400
+    user_id = g.user_id
     
     # Get user's attempt
     attempt = quiz_service.get_user_attempt(user_id, quiz_date)
     if not attempt:
-        return jsonify({"success": False, "message": "No attempt found"}), 404
+        return json_response({"success": False, "message": "No attempt found"}, 404)
     
     # Get progress information
     progress = attempt.get_progress()
     
-    return jsonify({
+    return json_response({
         "success": True,
         "progress": progress,
         "answers": attempt.get_answers_summary()
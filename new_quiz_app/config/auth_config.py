@@ -23,12 +23,6 @@ class AuthConfig:
     # Redirect URI - must match Azure AD app registration
     REDIRECT_PATH = "/auth/callback"
     
-    # Session configuration
-    SESSION_TYPE = "filesystem"
-    SESSION_PERMANENT = False
-    SESSION_USE_SIGNER = True
-    SESSION_KEY_PREFIX = "quiz_app:"
-    
     @classmethod
     def get_redirect_uri(cls, request):
         """Get the full redirect URI for the current request"""
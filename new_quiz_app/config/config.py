@@ -15,13 +15,27 @@ class Config:
     
     # MongoDB Configuration
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/ai_quiz')
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 200))  # Per worker; gevent runs many requests at once
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 10))  # Warm sockets kept open
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))  # Fail fast when the pool is exhausted
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 60000))  # Recycle sockets idle longer than this
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 3000))  # Fail fast when MongoDB is unreachable
+    MONGO_RECONNECT_INTERVAL = float(os.getenv('MONGO_RECONNECT_INTERVAL', 15))  # Seconds between background reconnect attempts
+    MONGO_COMPRESSORS = os.getenv('MONGO_COMPRESSORS', 'zstd,zlib')  # Wire compression, in order of preference
+    
+    # Redis Configuration (shared by sessions and caching)
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 64))
     
     # Session Configuration
-    SESSION_TYPE = "filesystem"
+    SESSION_TYPE = os.getenv('SESSION_TYPE', 'redis')  # 'redis', 'cookie' (signed, no server storage) or 'filesystem'
     SESSION_PERMANENT = False
     SESSION_USE_SIGNER = True
     SESSION_KEY_PREFIX = "quiz_app:"
     
+    # Logging Configuration
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    
     # Application Configuration
     QUIZ_ATTEMPTS_PER_DAY = 1  # Users can attempt quiz only once per day
     AUTO_SAVE_INTERVAL = 30  # Auto-save answers every 30 seconds
@@ -33,6 +47,12 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = 'uploads'
     
+    # Static Files Configuration (served by WhiteNoise)
+    STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', 86400))  # Browser cache lifetime in seconds
+    
+    # Template Configuration
+    JINJA_CACHE_DIR = os.getenv('JINJA_CACHE_DIR', '/tmp/jinja_cache')  # Compiled template bytecode
+    
     @classmethod
     def init_app(cls, app):
         """Initialize application with configuration"""
@@ -40,14 +60,21 @@ class Config:
         
         # Ensure upload folder exists
         os.makedirs(cls.UPLOAD_FOLDER, exist_ok=True)
+        
+        # Ensure template bytecode cache folder exists
+        os.makedirs(cls.JINJA_CACHE_DIR, exist_ok=True)
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
+    # Re-derived here: the base class default was computed from the base DEBUG
+    PREFERRED_URL_SCHEME = os.getenv('PREFERRED_URL_SCHEME', 'http')
     
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
+    TEMPLATES_AUTO_RELOAD = False
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'WARNING')
     
 class TestingConfig(Config):
     """Testing configuration"""
@@ -1,11 +1,31 @@
 """
 Database configuration and connection setup
 """
-from flask_pymongo import PyMongo
-from pymongo import MongoClient
-import os
+import random
+import threading
+import time
+from pymongo import IndexModel
 from config.config import Config
 
+# Indexes for each collection, created with one createIndexes command per collection
+# (background builds don't block reads and writes on servers older than 4.2)
+COLLECTION_INDEXES = {
+    'quizzes': [
+        IndexModel("quiz_date", unique=True, background=True),
+        IndexModel("created_at", background=True)
+    ],
+    'attempts': [
+        IndexModel([("user_id", 1), ("quiz_date", 1)], unique=True, background=True),
+        IndexModel([("quiz_date", 1), ("is_completed", 1), ("percentage", -1)], background=True),
+        IndexModel([("user_id", 1), ("attempted_at", -1)], background=True)
+    ],
+    'users': [
+        IndexModel("user_id", unique=True, background=True),
+        IndexModel("email", background=True),
+        IndexModel("last_active", background=True)
+    ]
+}
+
 class Database:
     """Database connection and configuration manager"""
     
@@ -28,30 +48,61 @@ class Database:
         app.config["MONGO_URI"] = Config.MONGO_URI
         
         try:
-            # Initialize PyMongo
-            self.mongo = PyMongo(app)
-            self.db = self.mongo.db
-            
-            # Initialize collections
-            self.quizzes_collection = self.db.quizzes
-            self.attempts_collection = self.db.attempts
-            self.users_collection = self.db.users
-            
-            # Test connection
-            self.db.list_collection_names()
-            print("✅ MongoDB connection successful!")
-            
-            # Create indexes
-            self._create_indexes()
+            # Imported here so loading this module (e.g. from scripts) doesn't pull in Flask-PyMongo
+            from flask_pymongo import PyMongo
             
+            # Initialize PyMongo (one pooled client per worker process; connect=False
+            # defers opening sockets until first use, after gunicorn has forked)
+            self.mongo = PyMongo(
+                app,
+                maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+                minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+                waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                maxIdleTimeMS=Config.MONGO_MAX_IDLE_TIME_MS,
+                serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                compressors=Config.MONGO_COMPRESSORS,
+                connect=False
+            )
         except Exception as e:
+            # Bad URI or options; retrying won't help
             print(f"❌ MongoDB connection failed: {e}")
             self.mongo = None
-            self.db = None
-            self.quizzes_collection = None
-            self.attempts_collection = None
-            self.users_collection = None
             print("⚠️  Application will run without database functionality")
+            return
+        
+        if not self._connect():
+            print("⚠️  Application will run without database functionality until MongoDB is reachable")
+            threading.Thread(target=self._reconnect_loop, name="mongo-reconnect", daemon=True).start()
+    
+    def _connect(self) -> bool:
+        """Check that MongoDB is reachable and, if so, set up the collections and indexes"""
+        try:
+            database = self.mongo.db
+            
+            # Test connection (ping is answered without scanning the catalog)
+            database.command('ping')
+        except Exception as e:
+            print(f"❌ MongoDB connection failed: {e}")
+            return False
+        
+        # Initialize collections (db is set last, so is_connected() only turns true once all are ready)
+        self.quizzes_collection = database.quizzes
+        self.attempts_collection = database.attempts
+        self.users_collection = database.users
+        self.db = database
+        print("✅ MongoDB connection successful!")
+        
+        # Create indexes
+        self._create_indexes()
+        return True
+    
+    def _reconnect_loop(self):
+        """Retry the connection in the background until MongoDB comes back"""
+        while True:
+            # Jitter keeps workers from retrying in lockstep
+            time.sleep(Config.MONGO_RECONNECT_INTERVAL + random.uniform(0, Config.MONGO_RECONNECT_INTERVAL / 3))
+            if self._connect():
+                return
     
     def _create_indexes(self):
         """Create necessary database indexes"""
@@ -63,33 +114,35 @@ class Database:
                 print("⚠️ Warning: Collections not available, skipping index creation")
                 return
             
-            # Quiz indexes
-            self.quizzes_collection.create_index("quiz_date", unique=True)
-            self.quizzes_collection.create_index("created_at")
-            
-            # Attempt indexes
-            self.attempts_collection.create_index([("user_id", 1), ("quiz_date", 1)], unique=True)
-            self.attempts_collection.create_index("quiz_date")
-            self.attempts_collection.create_index("attempted_at")
-            self.attempts_collection.create_index("user_id")
+            collections = self.get_collections()
+            failed = []
             
-            # User indexes
-            self.users_collection.create_index("user_id", unique=True)
-            self.users_collection.create_index("email")
-            self.users_collection.create_index("last_active")
+            # One round-trip per collection; a failure (e.g. an existing index
+            # with different options) doesn't stop the other collections
+            for name, indexes in COLLECTION_INDEXES.items():
+                try:
+                    collection = collections[name]
+                    
+                    # Only build indexes whose key pattern isn't there yet (warm restarts
+                    # skip createIndexes, and its collection locks, entirely)
+                    existing = {tuple(index['key'].items()) for index in collection.list_indexes()}
+                    missing = [index for index in indexes if tuple(index.document['key'].items()) not in existing]
+                    if missing:
+                        collection.create_indexes(missing)
+                except Exception as e:
+                    failed.append(name)
+                    print(f"⚠️ Warning: Could not create {name} indexes: {e}")
             
-            print("✅ Database indexes created successfully!")
+            if not failed:
+                print("✅ Database indexes created successfully!")
             
         except Exception as e:
             print(f"⚠️ Warning: Could not create indexes: {e}")
     
     def is_connected(self):
-        """Check if database connection is available"""
-        return (
-            self.mongo is not None and 
-            self.db is not None and 
-            self.quizzes_collection is not None
-        )
+        """Check if database connection is available (no server round-trip)"""
+        # _connect() assigns db only after the ping and the collections, so it alone says ready
+        return self.db is not None
     
     def get_collections(self):
         """Get database collections"""
@@ -105,8 +158,8 @@ class Database:
             return False, "Database not connected"
         
         try:
-            # Test basic operations
-            self.db.list_collection_names()
+            # Round-trip to the server without enumerating collections
+            self.db.command('ping')
             return True, "Database healthy"
         except Exception as e:
             return False, f"Database error: {str(e)}"
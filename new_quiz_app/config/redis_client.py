@@ -0,0 +1,21 @@
+"""
+Redis connection setup
+"""
+import redis
+from config.config import Config
+
+# Shared connection pool so every Redis client in a worker reuses the same sockets
+_pool = None
+
+def get_redis():
+    """Get a Redis client backed by the process-wide connection pool"""
+    global _pool
+    
+    if _pool is None:
+        _pool = redis.BlockingConnectionPool.from_url(
+            Config.REDIS_URL,
+            max_connections=Config.REDIS_MAX_CONNECTIONS,
+            socket_keepalive=True
+        )
+    
+    return redis.Redis(connection_pool=_pool)
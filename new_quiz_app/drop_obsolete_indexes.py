@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+One-off migration: drop indexes made redundant by the compound attempts indexes
+
+Run once per database after deploying the new indexes:
+    python drop_obsolete_indexes.py
+"""
+import sys
+from pymongo import MongoClient
+from config.config import Config
+
+# attempts.user_id and attempts.quiz_date are prefixes of the compound indexes;
+# attempted_at is only ever sorted on per user
+OBSOLETE_INDEXES = {
+    'attempts': ['user_id_1', 'quiz_date_1', 'attempted_at_1']
+}
+
+def main():
+    """Drop every obsolete index that still exists"""
+    client = MongoClient(Config.MONGO_URI, serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS)
+    
+    try:
+        database = client.get_default_database()
+        
+        for name, index_names in OBSOLETE_INDEXES.items():
+            collection = database[name]
+            current_names = {index['name'] for index in collection.list_indexes()}
+            
+            for index_name in index_names:
+                if index_name in current_names:
+                    collection.drop_index(index_name)
+                    print(f"✅ Dropped redundant index {name}.{index_name}")
+                else:
+                    print(f"⚠️  Index {name}.{index_name} not found. Skipping.")
+    except Exception as e:
+        print(f"❌ Could not drop obsolete indexes: {e}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -6,125 +6,37 @@ Based on the working NiFi email sender approach
 """
 
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import json
 from datetime import datetime, timedelta
 import os
+import time
 from dotenv import load_dotenv
 import io
 import base64
 import csv
+import re
 import sys
+from email.utils import parsedate_to_datetime
 
 load_dotenv()
 
-class QuizAnalyticsEmailReporterRefreshToken:
-    def __init__(self):
-        # Microsoft Graph API configuration using refresh token approach
-        self.tenant_id = os.getenv('AZURE_TENANT_ID') or os.getenv('MICROSOFT_TENANT_ID')
-        self.client_id = os.getenv('AZURE_CLIENT_ID') or os.getenv('MICROSOFT_CLIENT_ID')
-        self.client_secret = os.getenv('AZURE_CLIENT_SECRET') or os.getenv('MICROSOFT_CLIENT_SECRET')
-        
-        # Refresh token for automated authentication (no browser needed)
-        # self.refresh_token = os.getenv('AZURE_REFRESH_TOKEN')
-        self.refresh_token = ""
+# Abbreviated month names, indexed by month number
+MONTHS = ('', 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
 
-        # self.api_url = "https://aiquiz.shorthills.ai/api/admin/analytics"
-        self.api_url = "http://localhost:8002/api/admin/analytics"
-        # Graph API endpoints
-        self.token_url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
-        self.send_mail_url = "https://graph.microsoft.com/v1.0/me/sendMail"
-        
-    def log_message(self, message, level="INFO"):
-        """Log message with timestamp"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"[{timestamp}] {level}: {message}")
-        
-    def get_access_token(self):
-        """Get a fresh access token using the refresh token (no browser needed)"""
-        if not all([self.tenant_id, self.client_id, self.client_secret, self.refresh_token]):
-            missing = []
-            if not self.tenant_id: missing.append('AZURE_TENANT_ID')
-            if not self.client_id: missing.append('AZURE_CLIENT_ID') 
-            if not self.client_secret: missing.append('AZURE_CLIENT_SECRET')
-            if not self.refresh_token: missing.append('AZURE_REFRESH_TOKEN')
-            
-            self.log_message(f"Missing environment variables: {', '.join(missing)}", "ERROR")
-            return None
-            
-        self.log_message("🔐 Getting fresh access token using refresh token...")
-        
-        token_data = {
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-            'grant_type': 'refresh_token',
-            'refresh_token': self.refresh_token,
-            'scope': 'User.Read Files.Read Files.Read.All Files.ReadWrite Files.ReadWrite.All Mail.Send Mail.ReadWrite offline_access'
-        }
-        
-        try:
-            response = requests.post(self.token_url, data=token_data)
-            
-            if response.status_code == 200:
-                token_response = response.json()
-                access_token = token_response.get('access_token')
-                
-                # Update refresh token if a new one is provided
-                new_refresh_token = token_response.get('refresh_token')
-                if new_refresh_token:
-                    self.refresh_token = new_refresh_token
-                    self.log_message("🔄 Refresh token updated")
-                
-                self.log_message("✅ Access token obtained successfully")
-                return access_token
-            else:
-                self.log_message(f"❌ Failed to get access token. Status: {response.status_code}", "ERROR")
-                self.log_message(f"Response: {response.text}", "ERROR")
-                return None
-                
-        except Exception as e:
-            self.log_message(f"❌ Exception getting access token: {str(e)}", "ERROR")
-            return None
-    
-    def fetch_analytics_data(self):
-        """Fetch 7-day analytics data from the API"""
-        try:
-            self.log_message("📊 Fetching analytics data from API...")
-            response = requests.get(self.api_url, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            self.log_message("✅ Analytics data fetched successfully")
-            return data
-        except requests.exceptions.RequestException as e:
-            self.log_message(f"❌ Error fetching analytics data: {e}", "ERROR")
-            return None
-    
-    def format_analytics_html(self, data):
-        """Format analytics data into a beautiful HTML email"""
-        if not data or not data.get('success'):
-            return "<p>Unable to fetch analytics data.</p>"
-        
-        overall_stats = data.get('overall_stats', {})
-        daily_stats = data.get('daily_stats', [])
-        
-        # Calculate additional metrics
-        total_participants = overall_stats.get('total_participants', 0)  # People who opened
-        total_submitted = overall_stats.get('total_submitted', overall_stats.get('total_attempts', 0))  # People who submitted
-        total_attempts = overall_stats.get('total_attempts', 0)  # Total completed attempts
-        total_quizzes = overall_stats.get('total_quizzes', 0)
-        date_range = overall_stats.get('date_range', 'N/A')
-        
-        # Calculate completion rate as (submitted/opened) * 100
-        # total_participants = people who opened quizzes
-        # total_submitted = people who submitted quizzes
-        completion_percentage = (total_submitted / max(total_participants, 1)) * 100
-        
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <style>
-                body {{
+def _display_date(date_obj):
+    """Format a date like 'Oct 05, 2025' without strftime"""
+    return f"{MONTHS[date_obj.month]} {date_obj.day:02d}, {date_obj.year}"
+
+def _to_graph_addrs(emails):
+    """Build Microsoft Graph recipient entries for a list of email addresses"""
+    return [{"emailAddress": {"address": email}} for email in emails]
+
+# Report stylesheet (a plain string, inserted into the header as-is)
+_EMAIL_CSS = """
+                body {
                     font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
                     line-height: 1.6;
                     color: #333;
@@ -132,8 +44,8 @@ class QuizAnalyticsEmailReporterRefreshToken:
                     margin: 0 auto;
                     padding: 20px;
                     background-color: #f8fafc;
-                }}
-                .header {{
+                }
+                .header {
                     background-color: #1e293b;
                     color: #ffffff !important;
                     padding: 30px;
@@ -141,83 +53,91 @@ class QuizAnalyticsEmailReporterRefreshToken:
                     text-align: center;
                     margin-bottom: 30px;
                     border: 2px solid #334155;
-                }}
-                .header h1 {{
+                }
+                .header h1 {
                     margin: 0 !important;
                     font-size: 28px !important;
                     font-weight: 700 !important;
                     color: #ffffff !important;
                     line-height: 1.2 !important;
-                }}
-                .header p {{
+                }
+                .header p {
                     margin: 10px 0 0 0 !important;
                     color: #ffffff !important;
                     font-size: 14px !important;
                     font-weight: 400 !important;
                     line-height: 1.4 !important;
-                }}
-                .table-container {{
+                }
+                .table-container {
                     background: white;
                     border-radius: 8px;
                     box-shadow: 0 1px 3px rgba(0,0,0,0.1);
                     margin-bottom: 30px;
                     overflow: hidden;
-                }}
-                .table-header {{
+                }
+                .table-header {
                     background: linear-gradient(135deg, #3b82f6, #1d4ed8);
                     color: white;
                     padding: 20px 25px;
                     font-weight: bold;
                     font-size: 16px;
-                }}
-                table {{
+                }
+                table {
                     width: 100%;
                     border-collapse: collapse;
-                }}
-                th, td {{
+                }
+                th, td {
                     padding: 15px 20px;
                     text-align: left;
                     border-bottom: 1px solid #e2e8f0;
-                }}
-                th {{
+                }
+                th {
                     background: #f1f5f9;
                     text-align: center;
                     font-size: 14px;
                     font-weight: 600;
                     color: #475569;
-                }}
-                tr:hover {{
+                }
+                tr:hover {
                     background: #f8fafc;
-                }}
-                .status-badge {{
+                }
+                .status-badge {
                     padding: 4px 8px;
                     border-radius: 4px;
                     font-size: 12px;
                     font-weight: 500;
-                }}
-                .status-active {{
+                }
+                .status-active {
                     background: #dcfce7;
                     color: #166534;
-                }}
-                .status-inactive {{
+                }
+                .status-inactive {
                     background: #fef2f2;
                     color: #991b1b;
-                }}
-                .footer {{
+                }
+                .footer {
                     text-align: center;
                     margin-top: 30px;
                     padding: 20px;
                     background: #f8fafc;
                     border-radius: 8px;
                     color: #64748b;
-                }}
-            </style>
+                }
+            """
+
+# Report HTML fragments, filled in with str.format
+_HEADER_TMPL = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <style>{css}</style>
         </head>
         <body>
             <div class="header">
                 <h1>📊 Weekly Quiz Report</h1>
                 <p>Performance Summary ({date_range})</p>
-                <p>Generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
+                <p>Generated on {generated_at}</p>
             </div>
             
             <div class="table-container">
@@ -236,31 +156,8 @@ class QuizAnalyticsEmailReporterRefreshToken:
                     </thead>
                     <tbody>
         """
-        
-        for day in daily_stats:
-            # Skip weekends (Saturday = 5, Sunday = 6)
-            date_obj = datetime.strptime(day['date'], '%Y-%m-%d')
-            if date_obj.weekday() in [5, 6]:  # Saturday or Sunday
-                continue
-                
-            date = date_obj.strftime('%b %d, %Y')
-            day_name = day.get('day_name', 'Unknown')
-            
-            quiz_status = "No Quiz" if day['quiz_title'] == "No quiz available" else "Active"
-            status_class = "status-inactive" if quiz_status == "No Quiz" else "status-active"
-            
-            participants_opened = day.get('total_opened', day.get('participants_count', 0))  # People who opened the quiz
-            participants_submitted = day.get('submitted_count', day.get('participants_count', 0))  # People who submitted
-            avg_score = day.get('average_score', 0)
-            avg_percentage = day.get('average_percentage', 0)
-            
-            # Calculate completion rate for this day (submitted/opened)
-            day_completion_rate = (participants_submitted / max(participants_opened, 1)) * 100 if participants_opened > 0 else 0
-            
-            # Calculate participation rate (opened/265)
-            participation_rate = (participants_opened / 265) * 100
-            
-            html_content += f"""
+
+_ROW_TMPL = """
                         <tr>
                             <td><strong>{date}</strong><br><small>{day_name}</small></td>
                             <td><span class="status-badge {status_class}">{quiz_status}</span></td>
@@ -271,8 +168,8 @@ class QuizAnalyticsEmailReporterRefreshToken:
                             <td style="text-align: center;"><strong>{participation_rate:.1f}%</strong></td>
                         </tr>
             """
-        
-        html_content += """
+
+_FOOTER_TMPL = """
                     </tbody>
                 </table>
             </div>
@@ -285,19 +182,242 @@ class QuizAnalyticsEmailReporterRefreshToken:
         </body>
         </html>
         """
+
+def _minify(markup):
+    """Collapse whitespace runs and drop whitespace between tags"""
+    return re.sub(r'>\s+<', '><', re.sub(r'\s+', ' ', markup)).strip()
+
+# Minified once at import; the indentation above is only for readability
+_EMAIL_CSS, _HEADER_TMPL, _ROW_TMPL, _FOOTER_TMPL = map(_minify, (_EMAIL_CSS, _HEADER_TMPL, _ROW_TMPL, _FOOTER_TMPL))
+
+class QuizAnalyticsEmailReporterRefreshToken:
+    def __init__(self):
+        # Microsoft Graph API configuration using refresh token approach
+        self.tenant_id = os.getenv('AZURE_TENANT_ID') or os.getenv('MICROSOFT_TENANT_ID')
+        self.client_id = os.getenv('AZURE_CLIENT_ID') or os.getenv('MICROSOFT_CLIENT_ID')
+        self.client_secret = os.getenv('AZURE_CLIENT_SECRET') or os.getenv('MICROSOFT_CLIENT_SECRET')
         
-        return html_content
+        # Refresh token for automated authentication (no browser needed)
+        # self.refresh_token = os.getenv('AZURE_REFRESH_TOKEN')
+        self.refresh_token = ""
+
+        # self.api_url = "https://aiquiz.shorthills.ai/api/admin/analytics"
+        self.api_url = "http://localhost:8002/api/admin/analytics"
+        # Graph API endpoints
+        self.token_url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
+        self.send_mail_url = "https://graph.microsoft.com/v1.0/me/sendMail"
+        
+        # Access token reused until shortly before it expires
+        self._access_token = None
+        self._token_expires_at = 0.0
+        
+        # One pooled session for the token, analytics and sendMail calls, so TLS
+        # connections are reused; throttled or failed GETs are retried with backoff.
+        # POSTs are never retried here: a replayed refresh-token grant can be rejected
+        # once the first one has rotated the token
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False  # Hand the last response back so its status gets logged
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        # sendMail retries are handled by send_mail() so Retry-After can be honoured
+        # without the adapter retrying underneath it
+        self.session.mount('https://graph.microsoft.com/', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.send_mail_attempts = 3
+        
+    def log_message(self, message, level="INFO"):
+        """Log message with timestamp"""
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        print(f"[{timestamp}] {level}: {message}")
+        
+    def get_access_token(self):
+        """Get an access token using the refresh token (no browser needed), reusing it until it expires"""
+        # Refresh a minute early so the token doesn't expire mid-send
+        if self._access_token and time.monotonic() < self._token_expires_at - 60:
+            return self._access_token
+        
+        if not all([self.tenant_id, self.client_id, self.client_secret, self.refresh_token]):
+            missing = []
+            if not self.tenant_id: missing.append('AZURE_TENANT_ID')
+            if not self.client_id: missing.append('AZURE_CLIENT_ID') 
+            if not self.client_secret: missing.append('AZURE_CLIENT_SECRET')
+            if not self.refresh_token: missing.append('AZURE_REFRESH_TOKEN')
+            
+            self.log_message(f"Missing environment variables: {', '.join(missing)}", "ERROR")
+            return None
+            
+        self.log_message("🔐 Getting fresh access token using refresh token...")
+        
+        token_data = {
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'grant_type': 'refresh_token',
+            'refresh_token': self.refresh_token,
+            'scope': 'User.Read Files.Read Files.Read.All Files.ReadWrite Files.ReadWrite.All Mail.Send Mail.ReadWrite offline_access'
+        }
+        
+        try:
+            response = self.session.post(self.token_url, data=token_data, timeout=30)
+            
+            if response.status_code == 200:
+                token_response = response.json()
+                access_token = token_response.get('access_token')
+                self._access_token = access_token
+                self._token_expires_at = time.monotonic() + int(token_response.get('expires_in', 0))
+                
+                # Update refresh token if a new one is provided
+                new_refresh_token = token_response.get('refresh_token')
+                if new_refresh_token:
+                    self.refresh_token = new_refresh_token
+                    self.log_message("🔄 Refresh token updated")
+                
+                self.log_message("✅ Access token obtained successfully")
+                return access_token
+            else:
+                self.log_message(f"❌ Failed to get access token. Status: {response.status_code}", "ERROR")
+                self.log_message(f"Response: {response.text}", "ERROR")
+                return None
+                
+        except Exception as e:
+            self.log_message(f"❌ Exception getting access token: {str(e)}", "ERROR")
+            return None
+    
+    def _retry_delay(self, response, attempt):
+        """Seconds to wait before the next sendMail attempt (Retry-After, or exponential backoff)"""
+        backoff = min(30, 2 ** attempt)
+        retry_after = response.headers.get('Retry-After')
+        if not retry_after:
+            return backoff
+        
+        try:
+            if retry_after.isdigit():
+                wait = int(retry_after)
+            else:
+                wait = (parsedate_to_datetime(retry_after) - datetime.now().astimezone()).total_seconds()
+        except (TypeError, ValueError):
+            return backoff
+        
+        return max(wait, backoff)
+    
+    def send_mail(self, headers, email_payload):
+        """POST to Graph sendMail, retrying throttled (429) and server error responses"""
+        for attempt in range(self.send_mail_attempts):
+            response = self.session.post(self.send_mail_url, headers=headers, json=email_payload, timeout=30)
+            
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            if attempt + 1 < self.send_mail_attempts:
+                delay = self._retry_delay(response, attempt)
+                self.log_message(f"⏳ sendMail returned {response.status_code}, retrying in {delay:.0f}s", "WARNING")
+                time.sleep(delay)
+        
+        return response
+    
+    def fetch_analytics_data(self):
+        """Fetch 7-day analytics data from the API"""
+        try:
+            self.log_message("📊 Fetching analytics data from API...")
+            response = self.session.get(self.api_url, timeout=30)
+            response.raise_for_status()
+            data = response.json()
+            self.log_message("✅ Analytics data fetched successfully")
+            return data
+        except requests.exceptions.RequestException as e:
+            self.log_message(f"❌ Error fetching analytics data: {e}", "ERROR")
+            return None
+    
+    def _prepare_daily_rows(self, daily_stats):
+        """Parse each weekday's stats once for both the HTML report and the CSV"""
+        rows = []
+        for day in daily_stats:
+            # Skip weekends (Saturday = 5, Sunday = 6)
+            date_obj = datetime.fromisoformat(day['date'])
+            if date_obj.weekday() in [5, 6]:  # Saturday or Sunday
+                continue
+            
+            participants_opened = day.get('total_opened', day.get('participants_count', 0))  # People who opened the quiz
+            participants_submitted = day.get('submitted_count', day.get('participants_count', 0))  # People who submitted
+            
+            rows.append({
+                'day': day,
+                'date_obj': date_obj,
+                'participants_opened': participants_opened,
+                'participants_submitted': participants_submitted,
+                # Completion rate for this day (submitted/opened)
+                'day_completion_rate': (participants_submitted / max(participants_opened, 1)) * 100 if participants_opened > 0 else 0,
+                # Participation rate (opened/265)
+                'participation_rate': (participants_opened / 265) * 100
+            })
+        return rows
+    
+    def format_analytics_html(self, data, daily_rows=None):
+        """Format analytics data into a beautiful HTML email"""
+        if not data or not data.get('success'):
+            return "<p>Unable to fetch analytics data.</p>"
+        
+        overall_stats = data.get('overall_stats', {})
+        if daily_rows is None:
+            daily_rows = self._prepare_daily_rows(data.get('daily_stats', []))
+        
+        # Calculate additional metrics
+        total_participants = overall_stats.get('total_participants', 0)  # People who opened
+        total_submitted = overall_stats.get('total_submitted', overall_stats.get('total_attempts', 0))  # People who submitted
+        total_attempts = overall_stats.get('total_attempts', 0)  # Total completed attempts
+        total_quizzes = overall_stats.get('total_quizzes', 0)
+        date_range = overall_stats.get('date_range', 'N/A')
+        
+        # Calculate completion rate as (submitted/opened) * 100
+        # total_participants = people who opened quizzes
+        # total_submitted = people who submitted quizzes
+        completion_percentage = (total_submitted / max(total_participants, 1)) * 100
+        
+        parts = [_HEADER_TMPL.format(
+            css=_EMAIL_CSS,
+            date_range=date_range,
+            generated_at=datetime.now().strftime('%B %d, %Y at %I:%M %p')
+        )]
+        
+        for row in daily_rows:
+            day = row['day']
+            quiz_status = "No Quiz" if day['quiz_title'] == "No quiz available" else "Active"
+            status_class = "status-inactive" if quiz_status == "No Quiz" else "status-active"
+            
+            parts.append(_ROW_TMPL.format(
+                date=_display_date(row['date_obj']),
+                day_name=day.get('day_name', 'Unknown'),
+                status_class=status_class,
+                quiz_status=quiz_status,
+                participants_opened=row['participants_opened'],
+                participants_submitted=row['participants_submitted'],
+                avg_score=day.get('average_score', 0),
+                avg_percentage=day.get('average_percentage', 0),
+                day_completion_rate=row['day_completion_rate'],
+                participation_rate=row['participation_rate']
+            ))
+        
+        parts.append(_FOOTER_TMPL)
+        
+        return "".join(parts)
     
-    def create_csv_attachment(self, data):
-        """Create CSV attachment with detailed analytics data"""
+    def create_csv_attachment(self, data, daily_rows=None):
+        """Create CSV attachment with detailed analytics data (UTF-8 bytes in a BytesIO)"""
         if not data or not data.get('success'):
             return None
         
-        daily_stats = data.get('daily_stats', [])
+        if daily_rows is None:
+            daily_rows = self._prepare_daily_rows(data.get('daily_stats', []))
         
-        # Create CSV in memory
-        csv_buffer = io.StringIO()
-        writer = csv.writer(csv_buffer)
+        # Create CSV in memory, encoded as it is written
+        csv_buffer = io.BytesIO()
+        csv_text = io.TextIOWrapper(csv_buffer, encoding='utf-8', newline='')
+        writer = csv.writer(csv_text)
         
         # Write header
         writer.writerow([
@@ -306,66 +426,57 @@ class QuizAnalyticsEmailReporterRefreshToken:
         ])
         
         # Write data rows (exclude weekends)
-        for day in daily_stats:
-            # Skip weekends (Saturday = 5, Sunday = 6)
-            date_obj = datetime.strptime(day['date'], '%Y-%m-%d')
-            if date_obj.weekday() in [5, 6]:  # Saturday or Sunday
-                continue
-                
-            participants_opened = day.get('total_opened', day.get('participants_count', 0))
-            participants_submitted = day.get('submitted_count', day.get('participants_count', 0))
-            completion_rate = (participants_submitted / max(participants_opened, 1)) * 100 if participants_opened > 0 else 0
-            participation_rate = (participants_opened / 265) * 100
-            
+        for row in daily_rows:
+            day = row['day']
             writer.writerow([
                 day['date'],
                 day.get('day_name', ''),
                 day.get('quiz_title', ''),
-                participants_opened,
-                participants_submitted,
+                row['participants_opened'],
+                row['participants_submitted'],
                 day.get('average_score', 0),
                 day.get('average_percentage', 0),
-                f"{completion_rate:.1f}%",
-                f"{participation_rate:.1f}%"
+                f"{row['day_completion_rate']:.1f}%",
+                f"{row['participation_rate']:.1f}%"
             ])
         
-        return csv_buffer.getvalue()
+        # Detach so the buffer stays open when the wrapper is garbage collected
+        csv_text.flush()
+        csv_text.detach()
+        return csv_buffer
     
-    def send_email_report(self, recipients, cc_recipients=None, subject=None):
-        """Send the analytics report via Microsoft Graph API using refresh token"""
-        # Get access token using refresh token
-        access_token = self.get_access_token()
-        if not access_token:
-            return False
+    def _build_report_content(self, analytics_data):
+        """Build the default subject, HTML body and attachments for a report"""
+        date_range = analytics_data.get('overall_stats', {}).get('date_range', 'N/A')
+        subject = f"AI Quiz Analytics Report - {date_range}"
         
-        # Fetch analytics data
-        analytics_data = self.fetch_analytics_data()
-        if not analytics_data:
-            self.log_message("❌ Failed to fetch analytics data", "ERROR")
-            return False
-        
-        # Prepare email content
-        if not subject:
-            date_range = analytics_data.get('overall_stats', {}).get('date_range', 'N/A')
-            subject = f"AI Quiz Analytics Report - {date_range}"
+        # Parse the daily stats once for both the HTML body and the CSV
+        daily_rows = self._prepare_daily_rows(analytics_data.get('daily_stats', []))
         
         self.log_message("🎨 Generating HTML report...")
-        html_content = self.format_analytics_html(analytics_data)
+        html_content = self.format_analytics_html(analytics_data, daily_rows)
         
-        # Prepare recipients list
-        if isinstance(recipients, str):
-            recipients = [recipients]
-        
-        recipient_list = [{"emailAddress": {"address": email}} for email in recipients]
-        
-        # Prepare CC recipients list
-        cc_recipient_list = []
-        if cc_recipients:
-            if isinstance(cc_recipients, str):
-                cc_recipients = [cc_recipients]
-            cc_recipient_list = [{"emailAddress": {"address": email}} for email in cc_recipients]
+        # Add CSV attachment if available
+        attachments = []
+        self.log_message("📎 Creating CSV attachment...")
+        csv_buffer = self.create_csv_attachment(analytics_data, daily_rows)
+        if csv_buffer:
+            # getbuffer() hands the bytes to base64 without copying them
+            csv_base64 = base64.b64encode(csv_buffer.getbuffer()).decode('ascii')
+            filename = f"quiz_analytics_{datetime.now().strftime('%Y%m%d')}.csv"
+            
+            attachments.append({
+                "@odata.type": "#microsoft.graph.fileAttachment",
+                "name": filename,
+                "contentType": "text/csv",
+                "contentBytes": csv_base64
+            })
+            self.log_message(f"✅ CSV attachment created: {filename}")
         
-        # Create email message in Microsoft Graph format
+        return subject, html_content, attachments
+    
+    def _build_email_payload(self, subject, html_content, recipient_list, cc_recipient_list=None, attachments=None):
+        """Build a Microsoft Graph sendMail payload"""
         email_payload = {
             "message": {
                 "subject": subject,
@@ -382,20 +493,46 @@ class QuizAnalyticsEmailReporterRefreshToken:
         if cc_recipient_list:
             email_payload["message"]["ccRecipients"] = cc_recipient_list
         
-        # Add CSV attachment if available
-        self.log_message("📎 Creating CSV attachment...")
-        csv_content = self.create_csv_attachment(analytics_data)
-        if csv_content:
-            csv_base64 = base64.b64encode(csv_content.encode()).decode()
-            filename = f"quiz_analytics_{datetime.now().strftime('%Y%m%d')}.csv"
-            
-            email_payload["message"]["attachments"] = [{
-                "@odata.type": "#microsoft.graph.fileAttachment",
-                "name": filename,
-                "contentType": "text/csv",
-                "contentBytes": csv_base64
-            }]
-            self.log_message(f"✅ CSV attachment created: {filename}")
+        if attachments:
+            email_payload["message"]["attachments"] = attachments
+        
+        return email_payload
+    
+    def send_email_report(self, recipients, cc_recipients=None, subject=None):
+        """Send the analytics report via Microsoft Graph API using refresh token"""
+        # Get access token using refresh token and fetch analytics data
+        # (independent round-trips, so they run at the same time)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            token_future = executor.submit(self.get_access_token)
+            data_future = executor.submit(self.fetch_analytics_data)
+            access_token = token_future.result()
+            analytics_data = data_future.result()
+        
+        if not access_token:
+            return False
+        
+        if not analytics_data:
+            self.log_message("❌ Failed to fetch analytics data", "ERROR")
+            return False
+        
+        # Prepare email content
+        default_subject, html_content, attachments = self._build_report_content(analytics_data)
+        subject = subject or default_subject
+        
+        # Prepare recipients list
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        recipient_emails = list(recipients)
+        recipient_list = _to_graph_addrs(recipient_emails)
+        
+        # Prepare CC recipients list
+        if isinstance(cc_recipients, str):
+            cc_recipients = [cc_recipients]
+        cc_emails = list(cc_recipients or [])
+        cc_recipient_list = _to_graph_addrs(cc_emails)
+        
+        # Create email message in Microsoft Graph format
+        email_payload = self._build_email_payload(subject, html_content, recipient_list, cc_recipient_list, attachments)
         
         # Send email via Graph API
         headers = {
@@ -404,16 +541,13 @@ class QuizAnalyticsEmailReporterRefreshToken:
         }
         
         try:
-            recipient_emails = [r['emailAddress']['address'] for r in recipient_list]
-            cc_emails = [r['emailAddress']['address'] for r in cc_recipient_list] if cc_recipient_list else []
-            
             self.log_message(f"📤 Sending email...")
             self.log_message(f"📮 To: {', '.join(recipient_emails)}")
             if cc_emails:
                 self.log_message(f"📄 CC: {', '.join(cc_emails)}")
             self.log_message(f"📧 Subject: {subject}")
             
-            response = requests.post(self.send_mail_url, headers=headers, json=email_payload)
+            response = self.send_mail(headers, email_payload)
             
             if response.status_code == 202:  # Accepted
                 self.log_message("✅ Email sent successfully!")
@@ -0,0 +1,21 @@
+"""
+Gunicorn configuration for production deployments
+
+Usage: gunicorn -c gunicorn.conf.py run:app
+"""
+import os
+
+# Server socket
+bind = f"0.0.0.0:{os.getenv('PORT', 8002)}"
+
+# Workers - gevent lets each worker keep many requests in flight while they
+# wait on MongoDB and Microsoft OAuth, instead of blocking one per process.
+# The gevent worker monkey-patches the standard library before loading the app.
+worker_class = "gevent"
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 500))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+
+# Load the app in each worker after fork so every worker gets its own
+# MongoDB client and background threads
+preload_app = False
@@ -1,19 +1,26 @@
 """
 Quiz data model
 """
-from datetime import datetime
 from typing import List, Dict, Optional
 from bson import ObjectId
+from utils.dates import utc_now
+
+# Placeholder for a missing answer (never a key in the options dict)
+_MISSING = object()
 
 class Quiz:
     """Quiz model representing a daily quiz"""
     
+    __slots__ = ('quiz_date', 'questions', 'total_questions', 'created_at', 'updated_at', 'id')
+    
     def __init__(self, quiz_date: str, questions: List[Dict], total_questions: int = None):
         self.quiz_date = quiz_date
         self.questions = questions
         self.total_questions = total_questions or len(questions)
-        self.created_at = datetime.utcnow()
-        self.updated_at = datetime.utcnow()
+        now = utc_now()
+        self.created_at = now
+        self.updated_at = now
+        self.id = None
     
     def to_dict(self) -> Dict:
         """Convert quiz to dictionary for database storage"""
@@ -102,8 +109,17 @@ class Quiz:
         return len(self.questions)
     
     def is_valid(self) -> bool:
-        """Check if quiz is valid"""
-        return len(self.validate()) == 0
+        """Check if quiz is valid (stops at the first problem instead of collecting errors)"""
+        if not self.quiz_date or not self.questions or self.total_questions <= 0:
+            return False
+        
+        for question in self.questions:
+            options = question.get('options')
+            if ('question' not in question or not isinstance(options, dict) or
+                len(options) < 2 or question.get('answer', _MISSING) not in options):
+                return False
+        
+        return True
     
     def __repr__(self):
         return f"<Quiz {self.quiz_date}: {self.total_questions} questions>" 
\ No newline at end of file
@@ -1,21 +1,29 @@
 """
 Quiz Attempt model to track user quiz attempts and answers
 """
-from datetime import datetime
 from typing import List, Dict, Optional
 from bson import ObjectId
+from utils.dates import utc_now
 
 class QuizAttempt:
     """Model representing a user's attempt at a quiz"""
     
+    # Attempts are created in bulk on analytics and history paths
+    __slots__ = (
+        'user_id', 'quiz_date', 'answers', '_by_index', 'score', 'total_questions',
+        'percentage', 'attempted_at', 'completed_at', 'is_completed', 'auto_saved', 'id'
+    )
+    
     def __init__(self, user_id: str, quiz_date: str, answers: List[Dict] = None):
         self.user_id = user_id
         self.quiz_date = quiz_date
         self.answers = answers or []
+        # question_index -> answer dict (the same dicts as in self.answers)
+        self._by_index = {answer['question_index']: answer for answer in self.answers}
         self.score = 0
         self.total_questions = 0
         self.percentage = 0.0
-        self.attempted_at = datetime.utcnow()
+        self.attempted_at = utc_now()
         self.completed_at = None
         self.is_completed = False
         self.auto_saved = False
@@ -45,12 +53,13 @@ class QuizAttempt:
         )
         
         if '_id' in data:
-            attempt.id = str(data['_id'])
+            # Kept as the ObjectId, since it's only used to address the document again
+            attempt.id = data['_id']
         
         attempt.score = data.get('score', 0)
         attempt.total_questions = data.get('total_questions', 0)
         attempt.percentage = data.get('percentage', 0.0)
-        attempt.attempted_at = data.get('attempted_at', datetime.utcnow())
+        attempt.attempted_at = data.get('attempted_at', utc_now())
         attempt.completed_at = data.get('completed_at')
         attempt.is_completed = data.get('is_completed', False)
         attempt.auto_saved = data.get('auto_saved', False)
@@ -66,36 +75,33 @@ class QuizAttempt:
             # Update existing answer
             existing_answer['selected_answer'] = selected_answer
             existing_answer['is_correct'] = is_correct
-            existing_answer['answered_at'] = datetime.utcnow()
+            existing_answer['answered_at'] = utc_now()
         else:
             # Add new answer
             answer = {
                 'question_index': question_index,
                 'selected_answer': selected_answer,
                 'is_correct': is_correct,
-                'answered_at': datetime.utcnow()
+                'answered_at': utc_now()
             }
             self.answers.append(answer)
+            self._by_index[question_index] = answer
     
     def get_answer_for_question(self, question_index: int) -> Optional[Dict]:
         """Get answer for a specific question"""
-        for answer in self.answers:
-            if answer['question_index'] == question_index:
-                return answer
-        return None
+        return self._by_index.get(question_index)
     
-    def calculate_score(self, correct_answers: Dict[int, str]) -> Dict:
-        """Calculate score based on correct answers"""
-        self.total_questions = len(correct_answers)
+    def calculate_score(self, correct_answers: List[str]) -> Dict:
+        """Calculate score based on correct answers (indexed by question)"""
+        total_questions = len(correct_answers)
+        self.total_questions = total_questions
         self.score = 0
         
-        for question_index, correct_answer in correct_answers.items():
-            user_answer = self.get_answer_for_question(question_index)
-            if user_answer and user_answer['selected_answer'] == correct_answer:
-                self.score += 1
-                user_answer['is_correct'] = True
-            elif user_answer:
-                user_answer['is_correct'] = False
+        for question_index, user_answer in self._by_index.items():
+            # Entries with a non-integer index (stored by older clients) never match a question
+            if isinstance(question_index, int) and 0 <= question_index < total_questions:
+                user_answer['is_correct'] = user_answer['selected_answer'] == correct_answers[question_index]
+                self.score += user_answer['is_correct']
         
         self.percentage = (self.score / self.total_questions * 100) if self.total_questions > 0 else 0
         
@@ -108,7 +114,7 @@ class QuizAttempt:
     def complete_attempt(self):
         """Mark attempt as completed"""
         self.is_completed = True
-        self.completed_at = datetime.utcnow()
+        self.completed_at = utc_now()
     
     def get_progress(self) -> Dict:
         """Get attempt progress information"""
@@ -121,16 +127,12 @@ class QuizAttempt:
         }
     
     def get_answers_summary(self) -> List[Dict]:
-        """Get summary of all answers"""
-        summary = []
-        for answer in self.answers:
-            summary.append({
-                'question_index': answer['question_index'],
-                'selected_answer': answer['selected_answer'],
-                'is_correct': answer.get('is_correct'),
-                'answered_at': answer['answered_at']
-            })
-        return summary
+        """Get summary of all answers.
+        
+        add_answer already stores every answer with exactly the summary fields,
+        so the answer dicts are shared rather than copied (callers must not mutate them).
+        """
+        return list(self.answers)
     
     def validate(self) -> List[str]:
         """Validate attempt data and return list of errors"""
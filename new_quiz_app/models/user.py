@@ -1,21 +1,26 @@
 """
 User model representing authenticated users
 """
-from datetime import datetime
 from typing import Dict, Optional
 from bson import ObjectId
+from utils.dates import utc_now
 
 class User:
     """Model representing an authenticated user"""
     
+    __slots__ = (
+        'user_id', 'email', 'name', 'given_name', 'family_name',
+        'created_at', 'last_active', 'is_active', 'id'
+    )
+    
     def __init__(self, user_id: str, email: str, name: str = None, given_name: str = None, family_name: str = None):
         self.user_id = user_id
         self.email = email
         self.name = name or "Unknown User"
         self.given_name = given_name or ""
         self.family_name = family_name or ""
-        self.created_at = datetime.utcnow()
-        self.last_active = datetime.utcnow()
+        self.created_at = utc_now()
+        self.last_active = utc_now()
         self.is_active = True
     
     def to_dict(self) -> Dict:
@@ -58,7 +63,7 @@ class User:
     
     def update_last_active(self):
         """Update last active timestamp"""
-        self.last_active = datetime.utcnow()
+        self.last_active = utc_now()
     
     def get_full_name(self) -> str:
         """Get user's full name"""
@@ -0,0 +1,76 @@
+"""
+Activity service for recording user last-active timestamps off the request path
+"""
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+from pymongo import UpdateOne
+from config.database import db
+from utils.dates import utc_now
+
+logger = logging.getLogger(__name__)
+
+class ActivityService:
+    """Collects user activity in memory and writes it to MongoDB in batches"""
+    
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self._pending = {}  # user_id -> latest activity timestamp
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        # Write pending updates at interpreter exit (registered once, not per start())
+        atexit.register(self.stop)
+    
+    def record(self, user_id: str, timestamp: Optional[datetime] = None):
+        """Queue a last-active update for a user (latest timestamp wins)"""
+        if not user_id:
+            return
+        
+        with self._lock:
+            self._pending[user_id] = timestamp or utc_now()
+    
+    def start(self):
+        """Start the background flush thread (safe to call more than once)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="activity-flush", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the background thread and write any pending updates"""
+        self._stop_event.set()
+        self.flush()
+    
+    def _run(self):
+        """Flush pending updates every flush_interval seconds"""
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+    
+    def flush(self):
+        """Write all pending activity updates in a single bulk operation"""
+        with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+        
+        if not db.is_connected():
+            return
+        
+        try:
+            db.users_collection.bulk_write(
+                [
+                    UpdateOne({"user_id": user_id}, {"$set": {"last_active": timestamp}})
+                    for user_id, timestamp in batch.items()
+                ],
+                ordered=False
+            )
+        except Exception as e:
+            logger.exception("Error updating user activity")
+
+# Global activity service instance
+activity_service = ActivityService()
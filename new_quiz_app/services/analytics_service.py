@@ -1,13 +1,123 @@
 """
 Analytics service for quiz performance and participation statistics
 """
-from datetime import datetime, date, timedelta
+import bisect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
 from config.database import db
 from models.quiz_attempt import QuizAttempt
 from models.user import User
 from bson import ObjectId
+from utils.cache import local_ttl_cache
+from utils.dates import today_date
 
+logger = logging.getLogger(__name__)
+
+# Dashboards and polling clients re-request analytics constantly; serve them
+# from memory for a short while instead of re-running the queries
+ANALYTICS_CACHE_TTL = 30
+
+# Attempt fields used by get_quiz_analytics
+QUIZ_ANALYTICS_ATTEMPT_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "score": 1,
+    "total_questions": 1,
+    "percentage": 1,
+    "completed_at": 1
+}
+
+# Attempt fields used by get_user_performance
+USER_PERFORMANCE_ATTEMPT_PROJECTION = {
+    "_id": 0,
+    "quiz_date": 1,
+    "score": 1,
+    "total_questions": 1,
+    "percentage": 1
+}
+
+# Runs independent analytics queries alongside the request thread so their
+# MongoDB round-trips overlap (green threads under the gevent worker)
+_query_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="analytics-query")
+
+# Score distribution buckets: lower bounds (percent) and labels, lowest bucket first
+SCORE_RANGE_EDGES = (60, 70, 80, 90)
+SCORE_RANGE_LABELS = ("Below 60%", "60-69%", "70-79%", "80-89%", "90-100%")
+
+def _cacheable(result: Dict) -> bool:
+    """Only successful analytics results are cached"""
+    return "error" not in result
+
+def _if_completed(value):
+    """$cond expression yielding value for completed attempts and null otherwise"""
+    return {"$cond": [{"$eq": ["$is_completed", True]}, value, None]}
+
+def last_7_days_pipeline(date_list: List[str]) -> List[Dict]:
+    """Aggregation grouping attempts per quiz date with counts, score stats and top 3
+    (joined with their user documents).
+    
+    $avg/$max/$min ignore the nulls from incomplete attempts; sorting before
+    $group and slicing the pushed list keeps the top 3 without $topN (MongoDB 5.2+).
+    """
+    return [
+        {"$match": {"quiz_date": {"$in": date_list}}},
+        {"$sort": {"percentage": -1}},
+        {"$group": {
+            "_id": "$quiz_date",
+            "opened": {"$sum": 1},
+            "opened_users": {"$addToSet": "$user_id"},
+            "submitted": {"$sum": _if_completed(1)},
+            "submitted_users": {"$addToSet": _if_completed("$user_id")},
+            "average_score": {"$avg": _if_completed("$score")},
+            "average_percentage": {"$avg": _if_completed("$percentage")},
+            "highest_score": {"$max": _if_completed("$score")},
+            "lowest_score": {"$min": _if_completed("$score")},
+            "completed": {"$push": _if_completed({
+                "user_id": "$user_id",
+                "score": "$score",
+                "total_questions": "$total_questions",
+                "percentage": "$percentage"
+            })}
+        }},
+        {"$project": {
+            "opened": 1,
+            "opened_users": 1,
+            "submitted": 1,
+            "submitted_users": 1,
+            "average_score": 1,
+            "average_percentage": 1,
+            "highest_score": 1,
+            "lowest_score": 1,
+            "top": {"$slice": [
+                {"$filter": {"input": "$completed", "cond": {"$ne": ["$$this", None]}}},
+                3
+            ]}
+        }},
+        # Names and emails for the top performers come back in the same round-trip
+        {"$lookup": {
+            "from": "users",
+            "localField": "top.user_id",
+            "foreignField": "user_id",
+            "as": "top_users"
+        }},
+        {"$project": {
+            "opened": 1,
+            "opened_users": 1,
+            "submitted": 1,
+            "submitted_users": 1,
+            "average_score": 1,
+            "average_percentage": 1,
+            "highest_score": 1,
+            "lowest_score": 1,
+            "top": 1,
+            "top_users": {"$map": {
+                "input": "$top_users",
+                "in": {"user_id": "$$this.user_id", "name": "$$this.name", "email": "$$this.email"}
+            }}
+        }}
+    ]
 
 class AnalyticsService:
     """Service for analyzing quiz performance and participation"""
@@ -15,6 +125,12 @@ class AnalyticsService:
     def __init__(self):
         pass
     
+    def clear_cache(self):
+        """Forget this process's cached analytics (e.g. after an attempt is submitted)"""
+        for method in (self.get_last_7_days_stats, self.get_quiz_analytics, self.get_user_performance):
+            method.cache_clear()
+    
+    @local_ttl_cache(ANALYTICS_CACHE_TTL, should_cache=_cacheable)
     def get_last_7_days_stats(self) -> Dict:
         """Get comprehensive statistics for the last 7 days of quizzes"""
         if not db.is_connected():
@@ -22,72 +138,71 @@ class AnalyticsService:
         
         try:
             # Calculate date range (last 7 days including today)
-            today = date.today()
+            today = today_date()
             start_date = today - timedelta(days=6)  # 7 days including today
             
-            # Generate list of dates
-            date_list = []
-            for i in range(7):
-                check_date = start_date + timedelta(days=i)
-                date_list.append(check_date.strftime('%Y-%m-%d'))
+            # Generate list of dates (keeping the date objects for day names)
+            dates = [start_date + timedelta(days=i) for i in range(7)]
+            date_list = [check_date.isoformat() for check_date in dates]
             
-            # Get quizzes for these dates
-            quizzes = list(db.quizzes_collection.find({
-                "quiz_date": {"$in": date_list}
-            }).sort("quiz_date", 1))
+            # Get quizzes for these dates (in the background, overlapping the attempts query)
+            quizzes_future = _query_executor.submit(lambda: list(db.quizzes_collection.find(
+                {"quiz_date": {"$in": date_list}},
+                {"_id": 0, "quiz_date": 1, "total_questions": 1}
+            ).sort("quiz_date", 1)))
             
-            # Get all attempts for these dates (both completed and incomplete)
-            all_attempts = list(db.attempts_collection.find({
-                "quiz_date": {"$in": date_list}
-            }))
+            # Group attempts per day on the server (both completed and incomplete);
+            # only completed attempts count for scoring and top performers.
+            # Runs alongside the quizzes query, so the method costs one round-trip
+            day_summaries = {
+                summary['_id']: summary
+                for summary in db.attempts_collection.aggregate(
+                    last_7_days_pipeline(date_list), allowDiskUse=True
+                )
+            }
+            quizzes = quizzes_future.result()
+            quizzes_by_date = {quiz['quiz_date']: quiz for quiz in quizzes}
             
-            # Get only completed attempts for scoring calculations
-            attempts = [a for a in all_attempts if a.get('is_completed', False)]
+            # Unique users across the whole range (the per-day sets overlap)
+            all_user_ids = set()
+            submitted_user_ids = set()
+            for summary in day_summaries.values():
+                all_user_ids.update(summary['opened_users'])
+                submitted_user_ids.update(summary['submitted_users'])
+            submitted_user_ids.discard(None)
             
-            # Get user information for all participants (both who opened and submitted)
-            all_user_ids = list(set([attempt['user_id'] for attempt in all_attempts]))
-            submitted_user_ids = list(set([attempt['user_id'] for attempt in attempts]))
-            users = list(db.users_collection.find({
-                "user_id": {"$in": all_user_ids}
-            }))
-            user_lookup = {user['user_id']: user for user in users}
+            # Only the top performers need names and emails (joined by the pipeline)
+            user_lookup = {
+                user['user_id']: user
+                for summary in day_summaries.values()
+                for user in summary['top_users']
+            }
             
             # Process statistics for each day
             daily_stats = []
             overall_stats = {
                 "total_participants": len(all_user_ids),      # Total unique users who opened quizzes
                 "total_submitted": len(submitted_user_ids),   # Total unique users who submitted quizzes  
-                "total_attempts": len(attempts),              # Total completed quiz attempts
-                "total_opened": len(all_attempts),            # Total quiz opens (including incomplete)
+                "total_attempts": sum(summary['submitted'] for summary in day_summaries.values()),  # Total completed quiz attempts
+                "total_opened": sum(summary['opened'] for summary in day_summaries.values()),      # Total quiz opens (including incomplete)
                 "total_quizzes": len(quizzes),
                 "date_range": f"{start_date.strftime('%Y-%m-%d')} to {today.strftime('%Y-%m-%d')}"
             }
             
-            for quiz_date in date_list:
-                quiz_info = next((q for q in quizzes if q['quiz_date'] == quiz_date), None)
-                day_attempts = [a for a in attempts if a['quiz_date'] == quiz_date]
-                day_all_attempts = [a for a in all_attempts if a['quiz_date'] == quiz_date]
-                
-                # Get day name
-                try:
-                    from datetime import datetime
-                    date_obj = datetime.strptime(quiz_date, '%Y-%m-%d')
-                    day_name = date_obj.strftime('%A')
-                except:
-                    day_name = 'Unknown'
+            for check_date, quiz_date in zip(dates, date_list):
+                quiz_info = quizzes_by_date.get(quiz_date)
+                summary = day_summaries.get(quiz_date)
+                opened_count = summary['opened'] if summary else 0
+                submitted_count = summary['submitted'] if summary else 0
+                day_name = check_date.strftime('%A')
                 
                 # Calculate completion rate
-                completion_rate = round((len(day_attempts) / len(day_all_attempts) * 100), 2) if day_all_attempts else 0
+                completion_rate = round((submitted_count / opened_count * 100), 2) if opened_count else 0
                 
-                if quiz_info and day_attempts:
-                    # Calculate statistics for this day
-                    scores = [attempt['score'] for attempt in day_attempts]
-                    percentages = [attempt['percentage'] for attempt in day_attempts]
-                    
-                    # Get top 3 performers
-                    top_performers = sorted(day_attempts, key=lambda x: x['percentage'], reverse=True)[:3]
+                if quiz_info and submitted_count:
+                    # Top 3 performers arrive already sorted by percentage
                     top_3 = []
-                    for performer in top_performers:
+                    for performer in summary['top']:
                         user_info = user_lookup.get(performer['user_id'], {})
                         top_3.append({
                             "name": user_info.get('name', 'Unknown User'),
@@ -102,13 +217,13 @@ class AnalyticsService:
                         "day_name": day_name,
                         "quiz_title": f"Quiz for {quiz_date}",
                         "total_questions": quiz_info.get('total_questions', 0),
-                        "participants_count": len(day_attempts),  # People who submitted
-                        "total_opened": len(day_all_attempts),    # People who opened the quiz
-                        "submitted_count": len(day_attempts),     # Explicit count of submissions
-                        "average_score": round(sum(scores) / len(scores), 2) if scores else 0,
-                        "average_percentage": round(sum(percentages) / len(percentages), 2) if percentages else 0,
-                        "highest_score": max(scores) if scores else 0,
-                        "lowest_score": min(scores) if scores else 0,
+                        "participants_count": submitted_count,  # People who submitted
+                        "total_opened": opened_count,           # People who opened the quiz
+                        "submitted_count": submitted_count,     # Explicit count of submissions
+                        "average_score": round(summary['average_score'], 2),
+                        "average_percentage": round(summary['average_percentage'], 2),
+                        "highest_score": summary['highest_score'],
+                        "lowest_score": summary['lowest_score'],
                         "top_3_performers": top_3,
                         "completion_rate": completion_rate
                     }
@@ -121,7 +236,7 @@ class AnalyticsService:
                         "quiz_title": f"Quiz for {quiz_date}",
                         "total_questions": quiz_info.get('total_questions', 0),
                         "participants_count": 0,          # People who submitted
-                        "total_opened": len(day_all_attempts),  # People who opened (could be > 0 even if none submitted)
+                        "total_opened": opened_count,     # People who opened (could be > 0 even if none submitted)
                         "submitted_count": 0,             # Explicit count of submissions
                         "average_score": 0,
                         "average_percentage": 0,
@@ -158,25 +273,30 @@ class AnalyticsService:
             }
             
         except Exception as e:
-            print(f"Error getting analytics: {e}")
+            logger.exception("Error getting analytics")
             return {"error": f"Error calculating statistics: {str(e)}"}
     
+    @local_ttl_cache(ANALYTICS_CACHE_TTL, should_cache=_cacheable)
     def get_quiz_analytics(self, quiz_date: str) -> Dict:
         """Get detailed analytics for a specific quiz date"""
         if not db.is_connected():
             return {"error": "Database not connected"}
         
         try:
-            # Get quiz info
-            quiz = db.quizzes_collection.find_one({"quiz_date": quiz_date})
+            # Get quiz info (only the question count, not the questions themselves)
+            quiz = db.quizzes_collection.find_one(
+                {"quiz_date": quiz_date},
+                {"_id": 0, "quiz_date": 1, "total_questions": 1}
+            )
             if not quiz:
                 return {"error": f"No quiz found for {quiz_date}"}
             
-            # Get all attempts for this quiz
-            attempts = list(db.attempts_collection.find({
-                "quiz_date": quiz_date,
-                "is_completed": True
-            }))
+            # Get all attempts for this quiz (scores are stored at submit time,
+            # so the per-question answers aren't needed here)
+            attempts = list(db.attempts_collection.find(
+                {"quiz_date": quiz_date, "is_completed": True},
+                QUIZ_ANALYTICS_ATTEMPT_PROJECTION
+            ))
             
             if not attempts:
                 return {
@@ -187,24 +307,24 @@ class AnalyticsService:
                 }
             
             # Get user information
-            user_ids = [attempt['user_id'] for attempt in attempts]
-            users = list(db.users_collection.find({
-                "user_id": {"$in": user_ids}
-            }))
-            user_lookup = {user['user_id']: user for user in users}
+            user_ids = {attempt['user_id'] for attempt in attempts}
+            user_lookup = {
+                user['user_id']: user
+                for user in db.users_collection.find(
+                    {"user_id": {"$in": list(user_ids)}},
+                    {"_id": 0, "user_id": 1, "name": 1, "email": 1}
+                )
+            }
             
             # Calculate detailed statistics
             scores = [attempt['score'] for attempt in attempts]
             percentages = [attempt['percentage'] for attempt in attempts]
             
-            # Score distribution
-            score_ranges = {
-                "90-100%": len([p for p in percentages if p >= 90]),
-                "80-89%": len([p for p in percentages if 80 <= p < 90]),
-                "70-79%": len([p for p in percentages if 70 <= p < 80]),
-                "60-69%": len([p for p in percentages if 60 <= p < 70]),
-                "Below 60%": len([p for p in percentages if p < 60])
-            }
+            # Score distribution (one bisect per attempt instead of a scan per range)
+            range_counts = [0] * len(SCORE_RANGE_LABELS)
+            for p in percentages:
+                range_counts[bisect.bisect_right(SCORE_RANGE_EDGES, p)] += 1
+            score_ranges = dict(zip(reversed(SCORE_RANGE_LABELS), reversed(range_counts)))  # Highest bucket first
             
             # All participants with details
             all_participants = []
@@ -234,9 +354,10 @@ class AnalyticsService:
             }
             
         except Exception as e:
-            print(f"Error getting quiz analytics: {e}")
+            logger.exception("Error getting quiz analytics")
             return {"error": f"Error calculating quiz statistics: {str(e)}"}
     
+    @local_ttl_cache(ANALYTICS_CACHE_TTL, maxsize=1024, should_cache=_cacheable)
     def get_user_performance(self, user_id: str, days: int = 30) -> Dict:
         """Get performance analytics for a specific user"""
         if not db.is_connected():
@@ -244,7 +365,7 @@ class AnalyticsService:
         
         try:
             # Calculate date range
-            today = date.today()
+            today = today_date()
             start_date = today - timedelta(days=days-1)
             date_list = []
             for i in range(days):
@@ -252,7 +373,10 @@ class AnalyticsService:
                 date_list.append(check_date.strftime('%Y-%m-%d'))
             
             # Get user info
-            user = db.users_collection.find_one({"user_id": user_id})
+            user = db.users_collection.find_one(
+                {"user_id": user_id},
+                {"_id": 0, "name": 1, "email": 1}
+            )
             if not user:
                 return {"error": "User not found"}
             
@@ -261,7 +385,7 @@ class AnalyticsService:
                 "user_id": user_id,
                 "quiz_date": {"$in": date_list},
                 "is_completed": True
-            }).sort("quiz_date", 1))
+            }, USER_PERFORMANCE_ATTEMPT_PROJECTION).sort("quiz_date", 1))
             
             if not attempts:
                 return {
@@ -300,5 +424,8 @@ class AnalyticsService:
             return {"success": True, **performance_data}
             
         except Exception as e:
-            print(f"Error getting user performance: {e}")
-            return {"error": f"Error calculating user performance: {str(e)}"} 
\ No newline at end of file
+            logger.exception("Error getting user performance")
+            return {"error": f"Error calculating user performance: {str(e)}"}
+
+# Global analytics service instance
+analytics_service = AnalyticsService()
@@ -1,27 +1,47 @@
 """
 Microsoft Authentication Service using MSAL
 """
-import msal
-from flask import session, request, url_for, current_app
+from functools import wraps
+from flask import session, request, url_for, current_app, g, redirect, flash
 from config.auth_config import AuthConfig
 from models.user import User
 from config.database import db
+from services.activity_service import activity_service
+from utils.json_response import json_response
+import logging
+import threading
 import uuid
-from datetime import datetime
+from utils.dates import utc_now
+
+logger = logging.getLogger(__name__)
 
 class AuthService:
     """Service for handling Microsoft authentication"""
     
+    # MSAL client shared by every request; it keeps the authority metadata
+    # and HTTP connections from the first login instead of refetching them
+    _msal_app = None
+    _msal_app_lock = threading.Lock()
+    
     def __init__(self):
         self.config = AuthConfig()
     
     def get_msal_app(self):
-        """Create MSAL confidential client application"""
-        return msal.ConfidentialClientApplication(
-            self.config.CLIENT_ID,
-            authority=self.config.AUTHORITY,
-            client_credential=self.config.CLIENT_SECRET
-        )
+        """Get the MSAL confidential client application (created once)"""
+        if AuthService._msal_app is None:
+            # Concurrent first logins would otherwise each build (and discard) a client
+            with AuthService._msal_app_lock:
+                if AuthService._msal_app is None:
+                    # msal (and its requests/cryptography stack) is only imported on first login
+                    from msal import ConfidentialClientApplication
+                    
+                    AuthService._msal_app = ConfidentialClientApplication(
+                        self.config.CLIENT_ID,
+                        authority=self.config.AUTHORITY,
+                        client_credential=self.config.CLIENT_SECRET,
+                        instance_discovery=False  # Authority is always login.microsoftonline.com
+                    )
+        return AuthService._msal_app
     
     def get_auth_url(self):
         """Generate Microsoft login URL"""
@@ -41,8 +61,8 @@ class AuthService:
     
     def handle_auth_callback(self, auth_code, state):
         """Handle the OAuth callback and get user information"""
-        # Verify state to prevent CSRF attacks
-        if state != session.get("state"):
+        # Verify state to prevent CSRF attacks (single use, so a callback can't be replayed)
+        if state != session.pop("state", None):
             raise ValueError("Invalid state parameter")
         
         msal_app = self.get_msal_app()
@@ -57,9 +77,10 @@ class AuthService:
         if "error" in result:
             raise Exception(f"Authentication error: {result.get('error_description', result['error'])}")
         
-        # Store tokens and user info in session
+        # Store user info in session (the Graph access token is never used and
+        # would roughly double the size of every session read)
         session["user"] = result.get("id_token_claims")
-        session["access_token"] = result.get("access_token")
+        self._clear_request_cache()
         
         # Create or update user in database
         user_info = self._extract_user_info(result.get("id_token_claims"))
@@ -79,8 +100,8 @@ class AuthService:
     
     def _create_or_update_user(self, user_info):
         """Create or update user in database"""
-        if not hasattr(db, 'is_connected') or not db.is_connected():
-            print("⚠️  Database not connected, skipping user creation")
+        if not db.is_connected():
+            logger.warning("Database not connected, skipping user creation")
             return None
         
         try:
@@ -92,7 +113,7 @@ class AuthService:
                 db.users_collection.update_one(
                     {"user_id": user_info["id"]},
                     {"$set": {
-                        "last_active": datetime.utcnow(),
+                        "last_active": utc_now(),
                         "name": user_info["name"],
                         "email": user_info["email"],
                         "given_name": user_info["given_name"],
@@ -116,7 +137,7 @@ class AuthService:
                     return new_user
                 
         except Exception as e:
-            print(f"Error creating/updating user: {e}")
+            logger.exception("Error creating/updating user")
             return None
     
     def get_current_user(self):
@@ -124,65 +145,86 @@ class AuthService:
         return session.get("user")
     
     def get_current_user_info(self):
-        """Get current user info from database"""
+        """Get current user info from database (looked up once per request)"""
+        if '_user_info' not in g:
+            g._user_info = self._load_current_user_info()
+        return g._user_info
+    
+    def _load_current_user_info(self):
+        """Load current user info from database"""
         user_data = self.get_current_user()
-        if not user_data or not hasattr(db, 'is_connected') or not db.is_connected():
+        if not user_data or not db.is_connected():
             return None
         
         try:
             user_id = user_data.get("oid", user_data.get("sub"))
-            user_doc = db.users_collection.find_one({"user_id": user_id})
-            if user_doc:
-                user_obj = User.from_dict(user_doc)
-                # Return dictionary representation for template compatibility
-                return user_obj.to_dict()
+            # Stored documents are User.to_dict() output already, so the
+            # document itself (minus _id) is the template-facing dict
+            return db.users_collection.find_one({"user_id": user_id}, {"_id": 0})
         except Exception as e:
-            print(f"Error getting user info: {e}")
+            logger.exception("Error getting user info")
         
         return None
     
     def is_authenticated(self):
-        """Check if user is currently authenticated"""
-        return "user" in session and session["user"] is not None
+        """Check if user is currently authenticated (checked once per request)"""
+        if '_authenticated' not in g:
+            g._authenticated = "user" in session and session["user"] is not None
+        return g._authenticated
+    
+    def _clear_request_cache(self):
+        """Forget per-request auth lookups after the session changes"""
+        g.pop('_authenticated', None)
+        g.pop('_user_info', None)
+        g.pop('_user_id', None)
     
     def logout(self):
         """Clear user session"""
         session.clear()
+        self._clear_request_cache()
     
     def get_logout_url(self):
         """Get Microsoft logout URL"""
         return f"{self.config.AUTHORITY}/oauth2/v2.0/logout?post_logout_redirect_uri={request.url_root}"
     
-    def require_auth(self, f):
-        """Decorator to require authentication for routes"""
-        from functools import wraps
-        from flask import redirect, url_for, flash
+    def require_auth(self, f=None, *, message=None, api=False, user_id_required=True):
+        """Decorator to require authentication for routes.
+        
+        The current user's ID is stored on g.user_id for the view. API routes
+        (api=True) get JSON errors instead of a redirect to the login page.
+        """
+        if f is None:
+            return lambda func: self.require_auth(func, message=message, api=api, user_id_required=user_id_required)
         
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if not self.is_authenticated():
-                flash("Please sign in to access this page.", "info")
+                if api:
+                    return json_response({"success": False, "message": "Authentication required"}, 401)
+                if message:
+                    flash(message, "info")
                 return redirect(url_for('auth.login'))
+            
+            g.user_id = self.get_user_id()
+            if user_id_required and not g.user_id:
+                if api:
+                    return json_response({"success": False, "message": "User identification failed"}, 400)
+                flash("Error: Could not identify user", "error")
+                return redirect(url_for('main.index'))
+            
             return f(*args, **kwargs)
         return decorated_function
     
     def get_user_id(self):
-        """Get current user ID"""
-        user = self.get_current_user()
-        if user:
-            return user.get("oid", user.get("sub"))
-        return None
+        """Get current user ID (read from the session once per request)"""
+        if '_user_id' not in g:
+            user = self.get_current_user()
+            g._user_id = user.get("oid", user.get("sub")) if user else None
+        return g._user_id
     
     def update_user_activity(self):
-        """Update user's last active timestamp"""
-        user_info = self.get_current_user_info()
-        if user_info and hasattr(db, 'is_connected') and db.is_connected():
-            try:
-                # user_info is now a dictionary, so use dict access
-                user_id = user_info.get('id') if isinstance(user_info, dict) else user_info.user_id
-                db.users_collection.update_one(
-                    {"user_id": user_id},
-                    {"$set": {"last_active": datetime.utcnow()}}
-                )
-            except Exception as e:
-                print(f"Error updating user activity: {e}") 
\ No newline at end of file
+        """Queue an update of the user's last active timestamp"""
+        activity_service.record(self.get_user_id())
+
+# Global authentication service instance
+auth_service = AuthService()
@@ -1,13 +1,60 @@
 """
 Quiz service for managing quizzes and user attempts
 """
-from datetime import datetime, date, timedelta
+import logging
+from datetime import timedelta
 from typing import List, Dict, Optional, Tuple
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from models.quiz import Quiz
 from models.quiz_attempt import QuizAttempt
 from models.user import User
 from config.database import db
 from config.config import Config
+from services.analytics_service import analytics_service
+from utils import cache
+from utils.dates import today_date, today_str, utc_now
+
+logger = logging.getLogger(__name__)
+
+# Cache TTL for a user's per-quiz status on the landing page
+STATUS_CACHE_TTL = 300
+
+# Quizzes don't change once created; keep parsed ones in memory for a while
+QUIZ_CACHE_TTL = 300
+
+# Attempt fields needed to describe a user's status on a quiz ($project stage);
+# only the number of answers is needed, so it is counted on the server
+ATTEMPT_STATUS_PROJECTION = {
+    "_id": 0,
+    "quiz_date": 1,
+    "is_completed": 1,
+    "score": 1,
+    "total_questions": 1,
+    "percentage": 1,
+    "answered_count": {"$size": {"$ifNull": ["$answers", []]}}
+}
+
+# Quiz fields shown in the landing page's recent quiz list, without the question bodies
+# (older quiz documents without total_questions get it counted server-side)
+RECENT_QUIZ_PROJECTION = {
+    "_id": 0,
+    "quiz_date": 1,
+    "total_questions": {"$ifNull": ["$total_questions", {"$size": {"$ifNull": ["$questions", []]}}]}
+}
+
+# Attempt fields listed in a user's quiz history
+HISTORY_ATTEMPT_PROJECTION = {
+    "_id": 0,
+    "quiz_date": 1,
+    "score": 1,
+    "total_questions": 1,
+    "percentage": 1,
+    "is_completed": 1,
+    "attempted_at": 1,
+    "completed_at": 1
+}
 
 class QuizService:
     """Service for managing quiz operations"""
@@ -17,12 +64,14 @@ class QuizService:
     
     def get_today_string(self) -> str:
         """Get today's date as string in YYYY-MM-DD format"""
-        return date.today().strftime('%Y-%m-%d')
+        return today_str()
     
+    # Misses aren't cached, so a quiz created in another worker shows up immediately
+    @cache.local_ttl_cache(QUIZ_CACHE_TTL, maxsize=256, should_cache=lambda quiz: quiz is not None)
     def get_quiz_by_date(self, quiz_date: str) -> Optional[Quiz]:
-        """Get quiz for a specific date"""
+        """Get quiz for a specific date (parsed quizzes are cached in this process)"""
         if not db.is_connected():
-            print("⚠️  Database not connected, returning None")
+            logger.warning("Database not connected, returning None")
             return None
         
         try:
@@ -30,7 +79,7 @@ class QuizService:
             if quiz_doc:
                 return Quiz.from_dict(quiz_doc)
         except Exception as e:
-            print(f"Error getting quiz: {e}")
+            logger.exception("Error getting quiz")
         
         return None
     
@@ -38,49 +87,80 @@ class QuizService:
         """Get today's quiz"""
         return self.get_quiz_by_date(self.get_today_string())
     
-    def get_recent_quizzes(self, days: int = 7) -> List[Dict]:
-        """Get quizzes from the past N days with attempt status for user"""
-        if not db.is_connected():
-            print("⚠️  Database not connected, returning empty list")
-            return []
+    def _find_recent_quizzes(self, days: int) -> List[Dict]:
+        """Query date and question count of the past N days of quizzes (errors propagate to the caller)"""
+        # Calculate date range
+        today = today_date()
+        start_date = today - timedelta(days=days-1)  # Include today
         
-        try:
-            # Calculate date range
-            today = date.today()
-            start_date = today - timedelta(days=days-1)  # Include today
-            
-            # Generate list of dates
-            date_list = []
-            for i in range(days):
-                check_date = start_date + timedelta(days=i)
-                date_list.append(check_date.strftime('%Y-%m-%d'))
-            
-            # Get quizzes for these dates
-            quizzes = list(db.quizzes_collection.find({
-                "quiz_date": {"$in": date_list}
-            }).sort("quiz_date", -1))  # Most recent first
-            
-            # Convert to Quiz objects
-            quiz_list = []
-            for quiz_doc in quizzes:
-                quiz = Quiz.from_dict(quiz_doc)
-                quiz_list.append({
-                    'quiz': quiz,
-                    'quiz_date': quiz.quiz_date,
-                    'total_questions': quiz.total_questions
-                })
-            
-            return quiz_list
-            
-        except Exception as e:
-            print(f"Error getting recent quizzes: {e}")
-            return []
+        # Get quizzes for these dates (YYYY-MM-DD strings sort like dates,
+        # so this is a single index range scan)
+        return list(db.quizzes_collection.find(
+            {"quiz_date": {"$gte": start_date.isoformat(), "$lte": today.isoformat()}},
+            projection=RECENT_QUIZ_PROJECTION,
+            sort=[("quiz_date", -1)]  # Most recent first
+        ))
+    
+    def get_cached_recent_quizzes(self, days: int = 7) -> List[Dict]:
+        """Get date and question count of recent quizzes, cached until midnight"""
+        def load():
+            # Failures return None so an empty fallback is never cached until midnight
+            if days <= 0 or not db.is_connected():
+                return None
+            try:
+                return self._find_recent_quizzes(days)
+            except Exception as e:
+                logger.exception("Error getting recent quizzes")
+                return None
+        
+        key = f"quizzes:recent:{self.get_today_string()}:{days}"
+        return cache.get_or_set(key, cache.seconds_until_midnight(), load) or []
     
-    def get_user_quiz_status(self, user_id: str, quiz_date: str) -> Dict:
-        """Get user's status for a specific quiz"""
-        attempt = self.get_user_attempt(user_id, quiz_date)
+    def get_user_statuses_bulk(self, user_id: str, quiz_dates: List[str]) -> Dict[str, Dict]:
+        """Get user's status for several quizzes with one cache read and at most one query"""
+        keys = [self._status_cache_key(user_id, quiz_date) for quiz_date in quiz_dates]
+        statuses = {
+            quiz_date: status
+            for quiz_date, status in zip(quiz_dates, cache.get_many(keys))
+            if status is not None
+        }
+        
+        missing = [quiz_date for quiz_date in quiz_dates if quiz_date not in statuses]
+        if missing:
+            attempts = {}
+            query_failed = False
+            if db.is_connected():
+                try:
+                    attempts = {
+                        doc['quiz_date']: doc
+                        for doc in db.attempts_collection.aggregate([
+                            {"$match": {"user_id": user_id, "quiz_date": {"$in": missing}}},
+                            {"$project": ATTEMPT_STATUS_PROJECTION}
+                        ])
+                    }
+                except Exception as e:
+                    logger.exception("Error getting user attempts")
+                    query_failed = True
+            
+            loaded = {quiz_date: self._status_from_attempt(attempts.get(quiz_date)) for quiz_date in missing}
+            statuses.update(loaded)
+            
+            # Don't cache "not attempted" guesses made while the database is down or the query failed
+            if db.is_connected() and not query_failed:
+                cache.set_many(
+                    {self._status_cache_key(user_id, quiz_date): status for quiz_date, status in loaded.items()},
+                    STATUS_CACHE_TTL
+                )
         
-        if not attempt:
+        return statuses
+    
+    def _status_cache_key(self, user_id: str, quiz_date: str) -> str:
+        """Cache key for a user's status on a quiz"""
+        return f"attempt:{user_id}:{quiz_date}"
+    
+    def _status_from_attempt(self, attempt_doc: Optional[Dict]) -> Dict:
+        """Build the landing page status for an attempt document (None if not attempted)"""
+        if not attempt_doc:
             return {
                 'status': 'not_attempted',
                 'message': 'Ready to start',
@@ -88,10 +168,10 @@ class QuizService:
                 'button_text': '🚀 Start Quiz',
                 'button_class': 'btn-success'
             }
-        elif attempt.is_completed:
+        elif attempt_doc.get('is_completed', False):
             return {
                 'status': 'completed',
-                'message': f'Completed with {attempt.score}/{attempt.total_questions} ({attempt.percentage:.0f}%)',
+                'message': f"Completed with {attempt_doc.get('score', 0)}/{attempt_doc.get('total_questions', 0)} ({attempt_doc.get('percentage', 0.0):.0f}%)",
                 'action': 'view_results',
                 'button_text': '📊 View Results',
                 'button_class': 'btn-primary'
@@ -99,7 +179,7 @@ class QuizService:
         else:
             return {
                 'status': 'in_progress',
-                'message': f'In progress ({len(attempt.answers)} questions answered)',
+                'message': f"In progress ({attempt_doc.get('answered_count', 0)} questions answered)",
                 'action': 'resume',
                 'button_text': '▶️ Resume Quiz',
                 'button_class': 'btn-warning'
@@ -107,7 +187,7 @@ class QuizService:
     
     def create_quiz(self, quiz_data: Dict) -> Tuple[bool, str, Optional[Quiz]]:
         """Create a new quiz"""
-        if not hasattr(db, 'is_connected') or not db.is_connected():
+        if not db.is_connected():
             return False, "Database not connected", None
         
         try:
@@ -117,19 +197,19 @@ class QuizService:
                 questions=quiz_data['questions']
             )
             
-            # Validate quiz
-            validation_errors = quiz.validate()
-            if validation_errors:
+            # Validate quiz (errors are only collected when the quick check fails)
+            if not quiz.is_valid():
+                validation_errors = quiz.validate()
                 return False, f"Validation errors: {', '.join(validation_errors)}", None
             
-            # Check if quiz already exists for this date
-            existing_quiz = db.quizzes_collection.find_one({"quiz_date": quiz.quiz_date})
-            if existing_quiz:
+            # Insert quiz (the unique quiz_date index rejects a second quiz for the date)
+            try:
+                result = db.quizzes_collection.insert_one(quiz.to_dict())
+            except DuplicateKeyError:
                 return False, f"Quiz already exists for date {quiz.quiz_date}", None
-            
-            # Insert quiz
-            result = db.quizzes_collection.insert_one(quiz.to_dict())
             quiz.id = str(result.inserted_id)
+            cache.delete_pattern("quizzes:recent:*")
+            self.get_quiz_by_date.cache_clear()
             
             return True, "Quiz created successfully", quiz
             
@@ -138,7 +218,7 @@ class QuizService:
     
     def get_user_attempt(self, user_id: str, quiz_date: str) -> Optional[QuizAttempt]:
         """Get user's attempt for a specific quiz date"""
-        if not hasattr(db, 'is_connected') or not db.is_connected():
+        if not db.is_connected():
             return None
         
         try:
@@ -150,55 +230,52 @@ class QuizService:
             if attempt_doc:
                 return QuizAttempt.from_dict(attempt_doc)
         except Exception as e:
-            print(f"Error getting user attempt: {e}")
+            logger.exception("Error getting user attempt")
         
         return None
     
-    def can_user_attempt_quiz(self, user_id: str, quiz_date: str) -> Tuple[bool, str]:
-        """Check if user can attempt quiz for a specific date"""
-        if not hasattr(db, 'is_connected') or not db.is_connected():
-            return False, "Database not connected"
-        
-        # Check if quiz exists
-        quiz = self.get_quiz_by_date(quiz_date)
-        if not quiz:
-            return False, f"No quiz available for date {quiz_date}"
-        
-        # Check if user has already attempted this quiz
-        existing_attempt = self.get_user_attempt(user_id, quiz_date)
-        if existing_attempt and existing_attempt.is_completed:
-            return False, "You have already completed this quiz"
-        
-        return True, "User can attempt quiz"
-    
     def start_quiz_attempt(self, user_id: str, quiz_date: str) -> Tuple[bool, str, Optional[QuizAttempt]]:
-        """Start a new quiz attempt for user"""
-        can_attempt, message = self.can_user_attempt_quiz(user_id, quiz_date)
-        if not can_attempt:
-            return False, message, None
+        """Start a new quiz attempt for user, or resume their existing one.
         
-        if not hasattr(db, 'is_connected') or not db.is_connected():
+        A completed attempt is returned alongside the failure so callers can show it.
+        """
+        if not db.is_connected():
             return False, "Database not connected", None
         
+        # Get quiz to set total questions (usually served from the in-process cache)
+        quiz = self.get_quiz_by_date(quiz_date)
+        if not quiz:
+            return False, f"No quiz available for date {quiz_date}", None
+        
         try:
-            # Check if there's an existing incomplete attempt
-            existing_attempt = self.get_user_attempt(user_id, quiz_date)
-            
-            if existing_attempt and not existing_attempt.is_completed:
-                # Resume existing attempt
-                return True, "Resuming existing attempt", existing_attempt
-            
-            # Create new attempt
             attempt = QuizAttempt(user_id=user_id, quiz_date=quiz_date)
+            attempt.total_questions = quiz.get_total_questions()
+            
+            # Create the attempt or fetch the existing one in one round-trip;
+            # a pre-generated _id tells the two apart
+            new_id = ObjectId()
+            new_doc = attempt.to_dict()
+            del new_doc['user_id'], new_doc['quiz_date']  # Taken from the filter on insert
+            attempt_filter = {"user_id": user_id, "quiz_date": quiz_date}
+            try:
+                attempt_doc = db.attempts_collection.find_one_and_update(
+                    attempt_filter,
+                    {"$setOnInsert": {"_id": new_id, **new_doc}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Lost an insert race on the unique user_id + quiz_date index
+                attempt_doc = db.attempts_collection.find_one(attempt_filter)
+            
+            attempt = QuizAttempt.from_dict(attempt_doc)
+            if attempt.is_completed:
+                return False, "You have already completed this quiz", attempt
             
-            # Get quiz to set total questions
-            quiz = self.get_quiz_by_date(quiz_date)
-            if quiz:
-                attempt.total_questions = quiz.get_total_questions()
+            if attempt_doc['_id'] != new_id:
+                return True, "Resuming existing attempt", attempt
             
-            # Insert attempt
-            result = db.attempts_collection.insert_one(attempt.to_dict())
-            attempt.id = str(result.inserted_id)
+            cache.delete(self._status_cache_key(user_id, quiz_date))
             
             return True, "New attempt started", attempt
             
@@ -207,46 +284,64 @@ class QuizService:
     
     def save_answer(self, user_id: str, quiz_date: str, question_index: int, selected_answer: str) -> Tuple[bool, str]:
         """Save user's answer for a question"""
-        if not hasattr(db, 'is_connected') or not db.is_connected():
-            return False, "Database not connected"
+        success, message, _ = self.save_answers_bulk(user_id, quiz_date, {question_index: selected_answer})
+        return success, ("Answer saved successfully" if success else message)
+    
+    def save_answers_bulk(self, user_id: str, quiz_date: str, answers: Dict[int, str]) -> Tuple[bool, str, int]:
+        """Save several answers with a single atomic update; returns (success, message, saved_count)"""
+        if not db.is_connected():
+            return False, "Database not connected", 0
         
         try:
-            # Get user's attempt
-            attempt = self.get_user_attempt(user_id, quiz_date)
-            if not attempt:
-                return False, "No active attempt found"
-            
-            # Do not allow saving after completion
-            if attempt.is_completed:
-                return False, "Quiz already completed"
-            
-            # Add/update answer
-            attempt.add_answer(question_index, selected_answer)
-            
-            # Convert attempt.id to ObjectId if it's a string
-            from bson import ObjectId
-            attempt_id = ObjectId(attempt.id) if isinstance(attempt.id, str) else attempt.id
-            
-            # Update in database
+            # Replace any earlier answers to these questions and append the new ones
+            # in one pipeline update; the filter skips completed attempts, so there
+            # is no read-then-write race with a submit
+            now = utc_now()
+            new_answers = [
+                {
+                    'question_index': question_index,
+                    'selected_answer': selected_answer,
+                    'is_correct': None,
+                    'answered_at': now
+                }
+                for question_index, selected_answer in answers.items()
+            ]
             result = db.attempts_collection.update_one(
-                {"_id": attempt_id},
-                {"$set": {
-                    "answers": attempt.answers,
+                {"user_id": user_id, "quiz_date": quiz_date, "is_completed": {"$ne": True}},
+                [{"$set": {
+                    "answers": {"$concatArrays": [
+                        {"$filter": {
+                            "input": {"$ifNull": ["$answers", []]},
+                            "cond": {"$not": [{"$in": ["$$this.question_index", list(answers)]}]}
+                        }},
+                        # $literal keeps answer text like "$5" from being read as a field path
+                        {"$literal": new_answers}
+                    ]},
                     "auto_saved": True
-                }}
+                }}]
             )
             
             if result.matched_count == 0:
-                return False, f"No attempt found with id {attempt.id}"
+                # Only failures pay for a read, to tell the two cases apart
+                attempt = self.get_user_attempt(user_id, quiz_date)
+                if attempt and attempt.is_completed:
+                    return False, "Quiz already completed", 0
+                return False, "No active attempt found", 0
+            
+            cache.delete(self._status_cache_key(user_id, quiz_date))
             
-            return True, "Answer saved successfully"
+            return True, "Answers saved successfully", len(answers)
             
         except Exception as e:
-            return False, f"Error saving answer: {str(e)}"
+            return False, f"Error saving answers: {str(e)}", 0
     
-    def submit_quiz(self, user_id: str, quiz_date: str) -> Tuple[bool, str, Optional[Dict]]:
-        """Submit completed quiz and calculate score"""
-        if not hasattr(db, 'is_connected') or not db.is_connected():
+    def submit_quiz(self, user_id: str, quiz_date: str, answers: Optional[Dict[int, str]] = None) -> Tuple[bool, str, Optional[QuizAttempt]]:
+        """Submit completed quiz and calculate score, returning the scored attempt.
+        
+        Answers posted with the submission are merged in first, so the attempt
+        is read and written only once.
+        """
+        if not db.is_connected():
             return False, "Database not connected", None
         
         try:
@@ -263,27 +358,25 @@ class QuizService:
             if not quiz:
                 return False, "Quiz not found", None
             
-            # Prepare correct answers dictionary
-            correct_answers = {}
-            for i, question in enumerate(quiz.questions):
-                correct_answers[i] = question['answer']
+            # Merge the submitted answers (overwriting any previous saves)
+            for question_index, selected_answer in (answers or {}).items():
+                attempt.add_answer(question_index, selected_answer)
+            
+            # Correct answers in question order
+            correct_answers = [question['answer'] for question in quiz.questions]
             
             # Calculate score
-            score_result = attempt.calculate_score(correct_answers)
+            attempt.calculate_score(correct_answers)
             
             # Mark attempt as completed
             attempt.complete_attempt()
             
-            # Convert attempt.id to ObjectId if it's a string
-            from bson import ObjectId
-            attempt_id = ObjectId(attempt.id) if isinstance(attempt.id, str) else attempt.id
-            
-            # Update in database
+            # Update in database (skipped if the quiz was submitted in the meantime)
             # Persist a normalized answers array with is_correct flags
             answers_with_flags = attempt.get_answers_summary()
             
             result = db.attempts_collection.update_one(
-                {"_id": attempt_id},
+                {"_id": attempt.id, "is_completed": {"$ne": True}},
                 {"$set": {
                     "score": attempt.score,
                     "total_questions": attempt.total_questions,
@@ -297,14 +390,17 @@ class QuizService:
             if result.matched_count == 0:
                 return False, f"Failed to update attempt {attempt.id}", None
             
-            return True, "Quiz submitted successfully", score_result
+            cache.delete(self._status_cache_key(user_id, quiz_date))
+            analytics_service.clear_cache()
+            
+            return True, "Quiz submitted successfully", attempt
             
         except Exception as e:
             return False, f"Error submitting quiz: {str(e)}", None
     
     def get_quiz_statistics(self, quiz_date: str) -> Dict:
         """Get statistics for a specific quiz date"""
-        if not hasattr(db, 'is_connected') or not db.is_connected():
+        if not db.is_connected():
             return {"error": "Database not connected"}
         
         try:
@@ -313,10 +409,20 @@ class QuizService:
             if not quiz:
                 return {"error": f"No quiz found for date {quiz_date}"}
             
-            # Get all attempts for this date
-            attempts = list(db.attempts_collection.find({"quiz_date": quiz_date}))
+            # Count and average this date's attempts on the server (one summary document)
+            completed = {"$eq": ["$is_completed", True]}
+            summary = next(db.attempts_collection.aggregate([
+                {"$match": {"quiz_date": quiz_date}},
+                {"$group": {
+                    "_id": None,
+                    "total_attempts": {"$sum": 1},
+                    "completed_attempts": {"$sum": {"$cond": [completed, 1, 0]}},
+                    "average_score": {"$avg": {"$cond": [completed, {"$ifNull": ["$score", 0]}, None]}},
+                    "average_percentage": {"$avg": {"$cond": [completed, {"$ifNull": ["$percentage", 0]}, None]}}
+                }}
+            ]), None)
             
-            if not attempts:
+            if not summary:
                 return {
                     "quiz_date": quiz_date,
                     "total_questions": quiz.get_total_questions(),
@@ -326,15 +432,11 @@ class QuizService:
                     "average_percentage": 0
                 }
             
-            # Calculate statistics
-            total_attempts = len(attempts)
-            completed_attempts = len([a for a in attempts if a.get('is_completed', False)])
-            
-            completed_scores = [a.get('score', 0) for a in attempts if a.get('is_completed', False)]
-            completed_percentages = [a.get('percentage', 0) for a in attempts if a.get('is_completed', False)]
-            
-            average_score = sum(completed_scores) / len(completed_scores) if completed_scores else 0
-            average_percentage = sum(completed_percentages) / len(completed_percentages) if completed_percentages else 0
+            # Calculate statistics ($avg is null when nothing was completed)
+            total_attempts = summary['total_attempts']
+            completed_attempts = summary['completed_attempts']
+            average_score = summary['average_score'] or 0
+            average_percentage = summary['average_percentage'] or 0
             
             return {
                 "quiz_date": quiz_date,
@@ -352,30 +454,34 @@ class QuizService:
     
     def get_user_quiz_history(self, user_id: str) -> List[Dict]:
         """Get user's quiz attempt history"""
-        if not hasattr(db, 'is_connected') or not db.is_connected():
+        if not db.is_connected():
             return []
         
         try:
-            attempts = list(db.attempts_collection.find(
+            # The answers aren't part of the history, so they're never fetched
+            attempts = db.attempts_collection.find(
                 {"user_id": user_id},
+                HISTORY_ATTEMPT_PROJECTION,
                 sort=[("attempted_at", -1)]
-            ))
-            
-            history = []
-            for attempt_doc in attempts:
-                attempt = QuizAttempt.from_dict(attempt_doc)
-                history.append({
-                    "quiz_date": attempt.quiz_date,
-                    "score": attempt.score,
-                    "total_questions": attempt.total_questions,
-                    "percentage": attempt.percentage,
-                    "is_completed": attempt.is_completed,
-                    "attempted_at": attempt.attempted_at,
-                    "completed_at": attempt.completed_at
-                })
+            )
             
-            return history
+            # Same defaults as QuizAttempt.from_dict, without building attempts
+            return [
+                {
+                    "quiz_date": attempt_doc['quiz_date'],
+                    "score": attempt_doc.get('score', 0),
+                    "total_questions": attempt_doc.get('total_questions', 0),
+                    "percentage": attempt_doc.get('percentage', 0.0),
+                    "is_completed": attempt_doc.get('is_completed', False),
+                    "attempted_at": attempt_doc.get('attempted_at'),
+                    "completed_at": attempt_doc.get('completed_at')
+                }
+                for attempt_doc in attempts
+            ]
             
         except Exception as e:
-            print(f"Error getting user history: {e}")
-            return [] 
\ No newline at end of file
+            logger.exception("Error getting user history")
+            return []
+
+# Global quiz service instance
+quiz_service = QuizService()
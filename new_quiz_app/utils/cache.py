@@ -0,0 +1,114 @@
+"""
+Redis cache-aside helpers (plus a small in-process TTL cache)
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Dict, List
+import orjson
+from config.redis_client import get_redis
+from utils.dates import today_str
+
+logger = logging.getLogger(__name__)
+
+def seconds_until_midnight() -> int:
+    """Seconds left until the end of the current day (minimum 1)"""
+    now = datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(int((midnight - now).total_seconds()), 1)
+
+def get_or_set(key: str, ttl: int, producer):
+    """Return the cached value for key, or compute it with producer and cache it"""
+    client = get_redis()
+
+    try:
+        cached = client.get(key)
+        if cached is not None:
+            return orjson.loads(cached)
+    except Exception as e:
+        logger.warning("Cache read failed for %s: %s", key, e)
+        return producer()
+
+    value = producer()
+    if value is not None:
+        try:
+            client.setex(key, ttl, orjson.dumps(value))
+        except Exception as e:
+            logger.warning("Cache write failed for %s: %s", key, e)
+
+    return value
+
+def get_many(keys: List[str]) -> List[Any]:
+    """Fetch several cached values in one round-trip (None for misses)"""
+    try:
+        return [orjson.loads(raw) if raw is not None else None for raw in get_redis().mget(keys)]
+    except Exception as e:
+        logger.warning("Cache read failed for %s keys: %s", len(keys), e)
+        return [None] * len(keys)
+
+def set_many(values: Dict[str, Any], ttl: int):
+    """Cache several values with the same TTL in one round-trip"""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for key, value in values.items():
+            pipe.setex(key, ttl, orjson.dumps(value))
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Cache write failed for %s keys: %s", len(values), e)
+
+def delete(*keys: str):
+    """Invalidate one or more cache keys"""
+    try:
+        get_redis().delete(*keys)
+    except Exception as e:
+        logger.warning("Cache invalidation failed for %s: %s", keys, e)
+
+def delete_pattern(pattern: str):
+    """Invalidate every cache key matching a glob pattern"""
+    try:
+        client = get_redis()
+        keys = list(client.scan_iter(match=pattern))
+        if keys:
+            client.delete(*keys)
+    except Exception as e:
+        logger.warning("Cache invalidation failed for %s: %s", pattern, e)
+
+def local_ttl_cache(ttl: float, maxsize: int = 128, should_cache=None):
+    """Decorator caching a method's results in this process for ttl seconds.
+    
+    Results are keyed by the call arguments and the current day, so entries
+    never survive midnight. Values are returned as-is (no serialization), so
+    callers must not mutate them. should_cache(result) can veto caching a result.
+    """
+    def decorator(func):
+        entries = {}  # key -> (expires_at, value)
+        lock = threading.Lock()
+        
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())), today_str())
+            now = time.monotonic()
+            
+            with lock:
+                entry = entries.get(key)
+                if entry is not None and entry[0] > now:
+                    return entry[1]
+            
+            value = func(self, *args, **kwargs)
+            if should_cache is None or should_cache(value):
+                with lock:
+                    if len(entries) >= maxsize:
+                        # Drop expired entries first, then the oldest ones
+                        for stale_key in [k for k, (expires_at, _) in entries.items() if expires_at <= now]:
+                            del entries[stale_key]
+                        while len(entries) >= maxsize:
+                            del entries[next(iter(entries))]
+                    entries[key] = (now + ttl, value)
+            
+            return value
+        
+        wrapper.cache_clear = entries.clear
+        return wrapper
+    return decorator
@@ -0,0 +1,39 @@
+"""
+Date helpers
+"""
+import time
+from datetime import date, datetime, timedelta
+from flask import g, has_request_context
+
+# (expires_at, date, day string) for the current day; rebuilt once the day rolls over
+_today_cache = (0.0, None, '')
+
+def _today_entry():
+    """Get the cached (expires_at, date, day string) entry for today"""
+    global _today_cache
+    entry = _today_cache
+
+    if time.time() >= entry[0]:
+        today = date.today()
+        midnight = datetime.combine(today + timedelta(days=1), datetime.min.time())
+        entry = _today_cache = (midnight.timestamp(), today, today.isoformat())
+
+    return entry
+
+def today_date() -> date:
+    """Get today's date (computed once per day)"""
+    return _today_entry()[1]
+
+def today_str() -> str:
+    """Get today's date as a YYYY-MM-DD string (computed once per day)"""
+    return _today_entry()[2]
+
+def utc_now() -> datetime:
+    """Get the current UTC time (naive), taken once per request inside a request"""
+    if not has_request_context():
+        return datetime.utcnow()
+
+    now = g.get('_utc_now')
+    if now is None:
+        now = g._utc_now = datetime.utcnow()
+    return now
@@ -0,0 +1,48 @@
+"""
+Fast JSON response helpers
+"""
+import hashlib
+import orjson
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+# Non-string keys (e.g. answers keyed by question index) are allowed and converted to strings
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+def json_response(data, status: int = 200):
+    """Serialize data with orjson and wrap it in a JSON response (bytes are sent as-is)"""
+    body = data if isinstance(data, bytes) else orjson.dumps(data, default=str, option=JSON_OPTIONS)
+    return current_app.response_class(
+        body,
+        status=status,
+        mimetype='application/json'
+    )
+
+def cacheable_json_response(data, max_age: int, stale_while_revalidate: int = 0, public: bool = True):
+    """JSON response with a weak ETag and Cache-Control (304 when the client copy matches).
+    
+    Pass public=False for payloads with personal data, so only the browser may cache them.
+    """
+    response = json_response(data)
+    response.set_etag(hashlib.blake2b(response.get_data(), digest_size=8).hexdigest(), weak=True)
+    # Built by hand: Werkzeug 2.3's cache_control has no stale-while-revalidate directive
+    directives = ['public' if public else 'private', f'max-age={max_age}']
+    if stale_while_revalidate:
+        directives.append(f'stale-while-revalidate={stale_while_revalidate}')
+    response.headers['Cache-Control'] = ', '.join(directives)
+    return response.make_conditional(request)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (request.get_json, jsonify and the tojson filter)"""
+
+    def dumps(self, obj, **kwargs):
+        # Formatting options such as indent/sort_keys only exist in the stdlib encoder
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=JSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        # Hooks such as the cookie session's object_hook only exist in the stdlib decoder
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
@@ -0,0 +1,67 @@
+"""
+Helpers for parsing uploaded quiz files
+"""
+import os
+from typing import Any, Dict, List, Union
+import ijson
+import msgspec
+import orjson
+
+# Files at least this large are parsed incrementally instead of read whole
+STREAMING_THRESHOLD = 1024 * 1024  # 1MB
+
+# Questions are kept as plain dicts so optional fields (e.g. explanation) survive
+# the upload; their contents are checked by Quiz.validate
+UploadedQuestion = Dict[str, Any]
+
+class UploadedQuiz(msgspec.Struct):
+    """A full quiz object as sent to the upload API"""
+    quiz_date: str
+    questions: List[UploadedQuestion]
+
+# Upload API payloads are either a full quiz object or a bare array of questions
+_payload_decoder = msgspec.json.Decoder(Union[UploadedQuiz, List[UploadedQuestion]])
+
+def decode_quiz_payload(raw: bytes) -> Union[UploadedQuiz, List[UploadedQuestion]]:
+    """Parse and shape-check an upload API payload in a single pass (raises ValueError)"""
+    try:
+        return _payload_decoder.decode(raw)
+    except msgspec.ValidationError as e:
+        raise ValueError(f"Invalid quiz data: {e}")
+    except msgspec.DecodeError:
+        raise ValueError("Invalid JSON data")
+
+def exceeds_upload_limit(req) -> bool:
+    """Check the declared Content-Length against MAX_CONTENT_LENGTH before reading the body"""
+    limit = req.max_content_length
+    return limit is not None and req.content_length is not None and req.content_length > limit
+
+def load_quiz_file(quiz_file) -> Dict:
+    """Parse an uploaded quiz file into a quiz dictionary.
+    
+    Accepts either an object with a "questions" array or a bare array of
+    questions. Large files are streamed with ijson so only the questions
+    themselves are held in memory, never the raw file contents.
+    """
+    stream = quiz_file.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    
+    try:
+        if size < STREAMING_THRESHOLD:
+            data = orjson.loads(stream.read())
+            return {'questions': data} if isinstance(data, list) else data
+        
+        prefix = 'item' if _first_token(stream) == b'[' else 'questions.item'
+        return {'questions': list(ijson.items(stream, prefix, use_float=True))}
+    except (orjson.JSONDecodeError, ijson.JSONError) as e:
+        raise ValueError(f"Invalid JSON in quiz file: {e}")
+
+def _first_token(stream) -> bytes:
+    """Peek at the first non-whitespace byte of the stream"""
+    while True:
+        char = stream.read(1)
+        if not char or not char.isspace():
+            stream.seek(0)
+            return char